@@ -0,0 +1,109 @@
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+class CommandRouter:
+    """Table-driven dispatcher for /commands.
+
+    Commands come from a manifest mapping name -> (module, function,
+    description). Only the manifest is read at startup; a command's module
+    is imported from the plugin package the first time it is used.
+    Handlers are called as handler(handlers, event, args) where handlers
+    is the MessageHandlers instance. Names are matched case-insensitively
+    and a /command@botname suffix is stripped; commands addressed to
+    another bot are ignored.
+    """
+
+    def __init__(self, manifest, package, bot_username=None):
+        self.package = package
+        self.bot_username = bot_username
+        self._commands = {}  # 小写命令名 -> 命令信息
+        for name, (module, function, description) in manifest.items():
+            self.add(name, module, function, description)
+        self.calls = 0
+        self.unknown = 0
+        self.ignored = 0
+
+    @property
+    def bot_username(self):
+        return self._bot_username
+
+    @bot_username.setter
+    def bot_username(self, username):
+        self._bot_username = username.lower() if username else None
+
+    def add(self, name, module, function, description=None):
+        """Declare a lazily loaded command (a description of None hides it from /help)"""
+        self._commands[name.lower()] = {
+            'name': name,
+            'module': module,
+            'function': function,
+            'description': description,
+            'handler': None
+        }
+
+    def register(self, name, handler, description=None):
+        """Register an already imported handler"""
+        self.add(name, None, None, description)
+        self._commands[name.lower()]['handler'] = handler
+
+    def parse(self, text):
+        """Return (command, args) for a /command message, or None if it is not one for this bot"""
+        if not text or text[0] != '/':
+            return None
+        parts = text[1:].split(None, 1)
+        if not parts:
+            return None
+        command, _, target = parts[0].partition('@')
+        # 群组中发给其他机器人的命令（/help@OtherBot）
+        if target and self.bot_username and target.lower() != self.bot_username:
+            self.ignored += 1
+            return None
+        return command.lower(), parts[1] if len(parts) > 1 else ''
+
+    def resolve(self, command):
+        """Return the handler for a parsed command, importing its plugin module on first use"""
+        entry = self._commands.get(command)
+        if entry is None:
+            return None
+        if entry['handler'] is None:
+            module = importlib.import_module(f"{self.package}.{entry['module']}")
+            entry['handler'] = getattr(module, entry['function'])
+            logger.info(f"Loaded command /{entry['name']} from {module.__name__}")
+        return entry['handler']
+
+    async def dispatch(self, handlers, event, text):
+        """Run the handler for text.
+
+        Returns True if a handler ran, False for an unknown command and
+        None if text is not a command for this bot.
+        """
+        parsed = self.parse(text)
+        if parsed is None:
+            return None
+        command, args = parsed
+        handler = self.resolve(command)
+        if handler is None:
+            self.unknown += 1
+            return False
+        self.calls += 1
+        await handler(handlers, event, args)
+        return True
+
+    def help_text(self):
+        lines = ["Available commands:"]
+        lines.extend(
+            f"/{entry['name']} - {entry['description']}"
+            for entry in self._commands.values() if entry['description']
+        )
+        return "\n".join(lines)
+
+    def stats(self):
+        return {
+            'commands': len(self._commands),
+            'loaded': sum(1 for entry in self._commands.values() if entry['handler'] is not None),
+            'calls': self.calls,
+            'unknown': self.unknown,
+            'ignored': self.ignored
+        }
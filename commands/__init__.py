@@ -0,0 +1,22 @@
+"""Bot command plugins.
+
+COMMANDS maps each command to (module, function, description). Only this
+manifest is read at startup; CommandRouter imports a module from this
+package the first time one of its commands is used. A description of
+None keeps the command out of /help.
+"""
+
+COMMANDS = {
+    'start': ('basic', 'start', 'Start the bot'),
+    'help': ('basic', 'help', 'Show this help message'),
+    'hi': ('basic', 'hi', 'Say hello'),
+    'content': ('features', 'content', 'Content management'),
+    'price': ('features', 'price', 'Price information'),
+    'event': ('features', 'event', 'Event management'),
+    'task': ('features', 'task', 'Task management'),
+    'news': ('features', 'news', 'News updates'),
+    'PNTs': ('features', 'pnts', 'PNTs information'),
+    'account': ('features', 'account', 'Account management'),
+    'version': ('basic', 'version', 'Show bot version'),
+    'pass': ('basic', 'password', None),
+}
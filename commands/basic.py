@@ -0,0 +1,17 @@
+"""Built-in bot commands"""
+
+async def start(handlers, event, args):
+    await handlers.reply(event, "Welcome to COS72 Bot! Use /help to see available commands.")
+
+async def help(handlers, event, args):
+    await handlers.reply(event, handlers.commands.help_text())
+
+async def hi(handlers, event, args):
+    await handlers.reply(event, "Hi, my friends，this is COS72 Bot。")
+
+async def version(handlers, event, args):
+    await handlers.reply(event, f"Bot version: {handlers.VERSION}")
+
+async def password(handlers, event, args):
+    # 命令只在群组中处理；密码只在私聊中发送
+    await handlers.reply(event, "请私聊机器人获取密码。")
@@ -0,0 +1,30 @@
+"""Feature commands advertised in /help.
+
+The features have no backend yet; each command acknowledges the call
+with the sender's name, and its real implementation goes here.
+"""
+
+async def acknowledge(handlers, event, feature):
+    username = handlers.display_name(await handlers.get_sender(event))
+    await handlers.reply(event, f"Hi {username}, you invoke function: {feature}")
+
+async def content(handlers, event, args):
+    await acknowledge(handlers, event, 'content')
+
+async def price(handlers, event, args):
+    await acknowledge(handlers, event, 'price')
+
+async def event(handlers, event, args):
+    await acknowledge(handlers, event, 'event')
+
+async def task(handlers, event, args):
+    await acknowledge(handlers, event, 'task')
+
+async def news(handlers, event, args):
+    await acknowledge(handlers, event, 'news')
+
+async def pnts(handlers, event, args):
+    await acknowledge(handlers, event, 'PNTs')
+
+async def account(handlers, event, args):
+    await acknowledge(handlers, event, 'account')
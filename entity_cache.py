@@ -0,0 +1,136 @@
+import logging
+import time
+from collections import OrderedDict
+from telethon.utils import resolve_id
+
+logger = logging.getLogger(__name__)
+
+class EntityCache:
+    """Bounded LRU cache with per-entry expiry for resolved Telegram entities"""
+
+    def __init__(self, max_size=256, ttl=3600, negative_ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, entity)
+        self._failures = OrderedDict()  # key -> (expires_at, error)
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize_key(target):
+        """Normalize a username, numeric ID or -100... ID into a cache key"""
+        if isinstance(target, bool):
+            return None
+        if isinstance(target, str):
+            target = target.strip()
+            for prefix in ('https://t.me/', 'http://t.me/', 't.me/', '@'):
+                if target.startswith(prefix):
+                    target = target[len(prefix):]
+            target = target.split('/')[0]
+            if target.lstrip('-').isdigit():
+                target = int(target)
+            elif target:
+                return ('username', target.lower())
+            else:
+                return None
+        if isinstance(target, int):
+            # -100xxxxxxxxxx 格式的ID需要还原为真实的频道ID
+            if target < 0:
+                target, _ = resolve_id(target)
+            return ('id', target)
+        return None
+
+    def get(self, key):
+        """Return the cached entity for key, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, entity = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entity
+
+    def set(self, key, entity):
+        """Store an entity under key and under its numeric ID"""
+        expires_at = time.monotonic() + self.ttl
+        keys = [key]
+        entity_id = getattr(entity, 'id', None) or getattr(entity, 'channel_id', None)
+        if entity_id and ('id', entity_id) != key:
+            keys.append(('id', entity_id))
+        for k in keys:
+            self._entries[k] = (expires_at, entity)
+            self._entries.move_to_end(k)
+            self._failures.pop(k, None)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_failure(self, key):
+        """Return the cached resolution error for key, or None"""
+        entry = self._failures.get(key)
+        if entry is None:
+            return None
+        expires_at, error = entry
+        if expires_at <= time.monotonic():
+            del self._failures[key]
+            return None
+        self.negative_hits += 1
+        return error
+
+    def set_failure(self, key, error):
+        """Remember that resolving key failed, for negative_ttl seconds"""
+        if not self.negative_ttl:
+            return
+        self._failures[key] = (time.monotonic() + self.negative_ttl, str(error))
+        self._failures.move_to_end(key)
+        while len(self._failures) > self.max_size:
+            self._failures.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop a single key"""
+        self._failures.pop(key, None)
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def invalidate_id(self, entity_id):
+        """Drop every key that points at the entity with the given ID"""
+        stale = [
+            k for k, (_, entity) in self._entries.items()
+            if k == ('id', entity_id)
+            or getattr(entity, 'id', None) == entity_id
+            or getattr(entity, 'channel_id', None) == entity_id
+        ]
+        for k in stale:
+            del self._entries[k]
+        if stale:
+            self.invalidations += 1
+            logger.info(f"Invalidated cached entity {entity_id} ({len(stale)} keys)")
+
+    def clear(self):
+        self._entries.clear()
+        self._failures.clear()
+
+    def stats(self):
+        """Return cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'negative_size': len(self._failures),
+            'negative_ttl': self.negative_ttl,
+            'negative_hits': self.negative_hits,
+            'coalesced': self.coalesced,
+            'invalidations': self.invalidations
+        }
@@ -1,27 +1,12 @@
 #!/bin/bash
 
-# 停止服务
-echo "===== 修复数据库锁定问题 ====="
-echo "停止所有服务..."
-./stop-service.sh
+# 会话已改为常驻内存并快照到 sessions/telegram.session.json，
+# 不再出现 "database is locked"。此脚本仅用于清理旧版本遗留的会话文件。
+echo "===== 清理旧版session文件 ====="
 
-# 检查是否有Python进程在运行
-echo "检查是否有Python进程在运行..."
-pids=$(ps aux | grep -v grep | grep python | grep main.py | awk '{print $2}')
-if [ -n "$pids" ]; then
-    echo "发现服务进程，将其终止: $pids"
-    kill -9 $pids
-    sleep 1
-fi
-
-# 清理session文件
-echo "清理session文件..."
+echo "清理旧版session文件..."
 find . -name "telegram_core_session*" -delete
-find ./sessions -name "telegram_session_*" -delete
+find ./sessions -name "telegram_session_*" -delete 2>/dev/null
 mkdir -p sessions
 
-echo "数据库锁定问题已修复"
-
-# 启动服务
-echo "重新启动服务..."
-./reload-service.sh 
\ No newline at end of file
+echo "旧版session文件已清理，当前会话快照保留在 sessions/ 目录"
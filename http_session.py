@@ -0,0 +1,74 @@
+import logging
+import asyncio
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+class HttpSession:
+    """Application-wide pooled aiohttp session for outbound downloads"""
+
+    def __init__(self, limit=100, limit_per_host=8, dns_cache_ttl=300, keepalive_timeout=30,
+                 connect_timeout=10, read_timeout=30, total_timeout=60, max_bytes=20 * 1024 * 1024):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout, sock_read=read_timeout)
+        self.max_bytes = max_bytes  # 单次下载的大小上限
+        self._session = None
+        self.requests = 0
+        self.errors = 0
+        self.bytes_downloaded = 0
+
+    @property
+    def session(self):
+        """Return the shared ClientSession, creating it on the running loop on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            logger.info(f"HTTP session created (limit={self.limit}, per host={self.limit_per_host})")
+        return self._session
+
+    async def fetch(self, url):
+        """Download url and return the body bytes, raising ValueError on HTTP errors"""
+        self.requests += 1
+        try:
+            async with self.session.get(url) as resp:
+                if resp.status != 200:
+                    raise ValueError(f'Failed to download image from URL: {resp.status}')
+                if resp.content_length and resp.content_length > self.max_bytes:
+                    raise ValueError(f'Download too large: {resp.content_length} bytes')
+                # 没有Content-Length时分块读取，超过上限立即中止
+                chunks, size = [], 0
+                async for chunk in resp.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f'Download too large: more than {self.max_bytes} bytes')
+                    chunks.append(chunk)
+            self.bytes_downloaded += size
+            return b''.join(chunks)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            self.errors += 1
+            raise
+
+    async def close(self):
+        """Close the pooled session and its connections"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP session closed")
+        self._session = None
+
+    def stats(self):
+        connector = self._session.connector if self._session and not self._session.closed else None
+        return {
+            'open': connector is not None,
+            'requests': self.requests,
+            'errors': self.errors,
+            'bytes_downloaded': self.bytes_downloaded,
+            'limit_per_host': self.limit_per_host
+        }
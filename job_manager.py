@@ -0,0 +1,128 @@
+import logging
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class JobManager:
+    """Track send jobs that run as background tasks on the main event loop"""
+
+    def __init__(self, max_jobs=1000, retention=3600):
+        self.max_jobs = max_jobs
+        self.retention = retention  # 已完成任务的保留时间（秒）
+        self._jobs = OrderedDict()  # job_id -> job
+        self._idempotency = {}  # idempotency key -> job_id
+        self._tasks = set()  # 保持对后台任务的引用，防止被回收
+
+    def submit(self, kind, coro_factory, idempotency_key=None):
+        """Start coro_factory() as a task on the running loop and return the job snapshot immediately"""
+        if idempotency_key and idempotency_key in self._idempotency:
+            job = self._jobs.get(self._idempotency[idempotency_key])
+            if job:
+                logger.info(f"Reusing job {job['id']} for idempotency key {idempotency_key}")
+                return self._snapshot(job)
+
+        self._prune()
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'state': 'queued',
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+            'idempotency_key': idempotency_key
+        }
+        self._jobs[job['id']] = job
+        if idempotency_key:
+            self._idempotency[idempotency_key] = job['id']
+
+        task = asyncio.get_running_loop().create_task(self._run(job, coro_factory))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"Job {job['id']} ({kind}) queued")
+        return self._snapshot(job)
+
+    def get(self, job_id):
+        """Return a job snapshot, or None if unknown"""
+        job = self._jobs.get(job_id)
+        return self._snapshot(job) if job else None
+
+    def get_many(self, job_ids):
+        """Return (snapshots, missing_ids) for a batch status query"""
+        found, missing = [], []
+        for job_id in job_ids:
+            job = self._jobs.get(job_id)
+            if job:
+                found.append(self._snapshot(job))
+            else:
+                missing.append(job_id)
+        return found, missing
+
+    def recent(self, limit=50):
+        jobs = list(self._jobs.values())[-limit:]
+        return [self._snapshot(job) for job in reversed(jobs)]
+
+    def stats(self):
+        states = {}
+        for job in self._jobs.values():
+            states[job['state']] = states.get(job['state'], 0) + 1
+        return {'jobs': len(self._jobs), 'states': states}
+
+    async def _run(self, job, coro_factory):
+        job['state'] = 'running'
+        job['started_at'] = time.time()
+        try:
+            result = await coro_factory()
+            # 兼容 (result, status_code) 形式的返回值
+            if isinstance(result, tuple):
+                result = result[0]
+            error = result.get('error') if isinstance(result, dict) else None
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {e}")
+            result, error = None, str(e)
+        job['finished_at'] = time.time()
+        job['result'] = result
+        job['error'] = error
+        job['state'] = 'failed' if error else 'succeeded'
+        logger.info(f"Job {job['id']} ({job['kind']}) {job['state']} in {job['finished_at'] - job['started_at']:.2f}s")
+
+    def _prune(self):
+        """Drop expired finished jobs and keep at most max_jobs"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] and now - job['finished_at'] > self.retention
+        ]
+        if len(self._jobs) - len(expired) >= self.max_jobs:
+            finished = [job_id for job_id, job in self._jobs.items() if job['finished_at'] and job_id not in expired]
+            expired.extend(finished[:len(self._jobs) - len(expired) - self.max_jobs + 1])
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if job['idempotency_key']:
+                self._idempotency.pop(job['idempotency_key'], None)
+
+    @staticmethod
+    def _snapshot(job):
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+        started, finished = job['started_at'], job['finished_at']
+        return {
+            'id': job['id'],
+            'kind': job['kind'],
+            'state': job['state'],
+            'created_at': iso(job['created_at']),
+            'started_at': iso(started),
+            'finished_at': iso(finished),
+            'timings': {
+                'queued_seconds': round((started or time.time()) - job['created_at'], 3),
+                'run_seconds': round(finished - started, 3) if started and finished else None
+            },
+            'result': job['result'],
+            'error': job['error']
+        }
@@ -0,0 +1,121 @@
+import logging
+import os
+import re
+import sys
+import time
+import queue
+import atexit
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 需要在日志中隐藏的内容
+DATA_URI_RE = re.compile(r'data:([\w/+.-]+);base64,[A-Za-z0-9+/=]+')
+BASE64_RE = re.compile(r'[A-Za-z0-9+/]{256,}={0,2}')
+SECRET_RE = re.compile(r'((?:password|passwd|token|secret|api_key|auth_key)[\'"]?\s*(?:is\s*)?[:=]\s*[\'"]?)[^\s\'",}]+', re.IGNORECASE)
+BOT_TOKEN_RE = re.compile(r'\b\d{6,12}:[A-Za-z0-9_-]{30,}\b')
+
+_listener = None
+
+class PayloadFilter(logging.Filter):
+    """Redact secrets and base64 blobs and truncate long log messages"""
+
+    def __init__(self, max_length=2000):
+        super().__init__()
+        self.max_length = max_length
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = self.redact(message)
+        if redacted != message:
+            # 已格式化的消息不再保留原始参数
+            record.msg = redacted
+            record.args = None
+        return True
+
+    def redact(self, message):
+        if 'base64,' in message:
+            message = DATA_URI_RE.sub(lambda m: f"data:{m.group(1)};base64,<{len(m.group(0))} chars>", message)
+        if len(message) >= 256:
+            message = BASE64_RE.sub(lambda m: f"<base64 {len(m.group(0))} chars>", message)
+        message = SECRET_RE.sub(r'\1***', message)
+        message = BOT_TOKEN_RE.sub('<bot token>', message)
+        if len(message) > self.max_length:
+            message = f"{message[:self.max_length]}... [{len(message) - self.max_length} more chars]"
+        return message
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogSampler:
+    """Per-key rate limit for noisy log lines (e.g. one line per group message)"""
+
+    def __init__(self, per_minute=20, max_keys=1000):
+        self.per_minute = per_minute
+        self.max_keys = max_keys
+        self._windows = {}  # key -> [window_start, logged, suppressed]
+
+    def allow(self, key):
+        """Return (allowed, suppressed): suppressed is the number of lines skipped since the last allowed one"""
+        if self.per_minute <= 0:
+            return True, 0
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= 60:
+            if window is None and len(self._windows) >= self.max_keys:
+                self._windows = {k: w for k, w in self._windows.items() if now - w[0] < 60}
+            suppressed = window[2] if window else 0
+            self._windows[key] = [now, 1, 0]
+            return True, suppressed
+        if window[1] < self.per_minute:
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+            return True, suppressed
+        window[2] += 1
+        return False, 0
+
+def setup_logging(log_file=None, level=None):
+    """Log through a queue so file/console writes happen on a background thread"""
+    global _listener
+    if _listener:
+        return _listener
+    log_file = log_file or os.getenv('LOG_FILE', 'bot.log')
+    level = level or os.getenv('LOG_LEVEL', 'INFO').upper()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', 10000))))
+    queue_handler.addFilter(PayloadFilter(int(os.getenv('LOG_MAX_MESSAGE_LENGTH', 2000))))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    """Flush queued records and stop the background thread"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
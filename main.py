@@ -1,20 +1,26 @@
 import tweepy_patch  # 添加补丁导入
 import logging
 import asyncio
-import threading
 import os
 import sys
+import signal
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from telegram_core import TelegramCore
 from telegram_api import TelegramAPI
+from http_session import HttpSession
+from scheduler import Scheduler
+from schedule_store import ScheduleStore
+from recurring_jobs import RecurringJobs
 from twitter_core import TwitterCore
 from twitter_api import TwitterAPI
 from web_service import WebService
 from message_handlers import MessageHandlers
 from telethon import events
-from flask import Flask
-from flask_cors import CORS
+from quart import Quart
+from hypercorn.asyncio import serve
+from hypercorn.config import Config as HypercornConfig
+from log_setup import setup_logging, stop_logging
 
 # 加载环境变量
 load_dotenv()
@@ -27,27 +33,45 @@ except ImportError:
 
 # 全局变量
 telegram_client = None
-
-def setup_logging():
-    """设置日志配置"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('bot.log'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+bot_service = None
+web_shutdown = None  # 设置后网页服务优雅退出
+web_task = None
 
 logger = logging.getLogger(__name__)
 
 class BotService:
     def __init__(self):
         self.telegram_core = TelegramCore()
-        self.telegram_api = TelegramAPI(core=self.telegram_core)
+        # 全局共享的HTTP连接池（图片下载等）
+        self.http = HttpSession(
+            limit=int(os.getenv('HTTP_POOL_LIMIT', 100)),
+            limit_per_host=int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', 8)),
+            dns_cache_ttl=int(os.getenv('HTTP_DNS_CACHE_TTL', 300)),
+            keepalive_timeout=float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 30)),
+            connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', 10)),
+            read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', 30)),
+            max_bytes=int(os.getenv('HTTP_MAX_DOWNLOAD_BYTES', 20 * 1024 * 1024))
+        )
+        # 持久化的定时任务调度，Telegram/Twitter共用
+        self.scheduler = Scheduler(
+            ScheduleStore(os.getenv('SCHEDULE_DB', 'sessions/schedule.db')),
+            missed_policy=os.getenv('SCHEDULER_MISSED_POLICY', 'send'),
+            missed_window=float(os.getenv('SCHEDULER_MISSED_WINDOW_MINUTES', 10)) * 60,
+            grace=float(os.getenv('SCHEDULER_GRACE_SECONDS', 60)),
+            prepare_lead=float(os.getenv('SCHEDULER_PREPARE_LEAD_SECONDS', 120))
+        )
+        self.telegram_api = TelegramAPI(core=self.telegram_core, http=self.http, scheduler=self.scheduler)
         self.twitter_core = TwitterCore()
-        self.twitter_api = TwitterAPI(core=self.twitter_core)
-        self.message_handlers = None
+        self.twitter_api = TwitterAPI(core=self.twitter_core, http=self.http, scheduler=self.scheduler)
+        # 周期任务（换密码、定时帖子、维护），按cron表达式在准确的时间点执行
+        self.recurring = RecurringJobs(timezone=os.getenv('RECURRING_JOBS_TIMEZONE') or None)
+        self.recurring.add('password_rotation', os.getenv('PASSWORD_ROTATION_CRON', '0 0 * * *'),
+                           self.telegram_core.rotate_password, 'Rotate the new member verification password')
+        if os.getenv('PERIODIC_POST_MESSAGE'):
+            self.recurring.add('periodic_post', os.getenv('PERIODIC_POST_CRON', '0 */3 * * *'),
+                               self.send_periodic_post, 'Post PERIODIC_POST_MESSAGE to the default group')
+        self.recurring.add('schedule_cleanup', os.getenv('SCHEDULE_CLEANUP_CRON', '30 3 * * *'),
+                           self.cleanup_schedules, 'Delete finished scheduled jobs past the retention period')
         self.is_running = False
         self.last_message_time = None
         
@@ -75,6 +99,8 @@ class BotService:
                 return False
             logger.info(f"Telegram API service status - is_running: {self.telegram_api.is_running}")
             
+            self.recurring.start()
+            
             # 暂时注释掉上线消息
             # await self.message_handlers.send_online_message()
             
@@ -89,8 +115,12 @@ class BotService:
     async def stop(self):
         """停止服务"""
         try:
-            if self.telegram_core.client:
-                await self.telegram_core.client.disconnect()
+            self.recurring.stop()
+            await self.scheduler.stop()
+            await self.telegram_core.stop()
+            # 停止Twitter线程池和账号信息刷新任务，HTTP会话最后关闭
+            await self.twitter_core.stop()
+            await self.http.close()
             self.is_running = False
             logger.info("Bot service stopped")
             return True
@@ -98,53 +128,23 @@ class BotService:
             logger.error(f"Error stopping bot service: {e}", exc_info=True)
             return False
             
-    async def send_random_message(self):
-        """发送随机消息"""
-        try:
-            if not self.is_running:
-                return
-                
-            # 生成随机消息
-            message = self.message_handlers.generate_random_message()
-            
-            # 发送消息
-            await self.telegram_core.send_message(message)
-            
-            # 更新最后发送时间
-            self.last_message_time = datetime.now()
-            
-            logger.info("Random message sent successfully")
-            
-        except Exception as e:
-            logger.error(f"Error sending random message: {e}", exc_info=True)
-            
-    async def run(self):
-        """运行服务"""
-        try:
-            while True:
-                if not self.is_running:
-                    # 尝试重启服务
-                    if await self.start():
-                        logger.info("Service restarted successfully")
-                    else:
-                        logger.error("Failed to restart service")
-                        await asyncio.sleep(60)  # 等待1分钟后重试
-                        continue
-                        
-                # 检查是否需要发送随机消息
-                now = datetime.now()
-                if (not self.last_message_time or 
-                    now - self.last_message_time >= timedelta(hours=3)):
-                    await self.send_random_message()
-                    
-                await asyncio.sleep(60)  # 每分钟检查一次
-                
-        except Exception as e:
-            logger.error(f"Error in main loop: {e}", exc_info=True)
-            self.is_running = False
+    async def send_periodic_post(self):
+        """发送定时帖子"""
+        if not self.is_running:
+            return
+        result = await self.telegram_core.send_message(os.getenv('PERIODIC_POST_MESSAGE'))
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        self.last_message_time = datetime.now()
+        logger.info("Periodic post sent successfully")
+
+    async def cleanup_schedules(self):
+        """清理过期的定时任务记录"""
+        await self.scheduler.purge(float(os.getenv('SCHEDULE_RETENTION_DAYS', 30)) * 86400)
             
 async def start_web_service():
     """Start the web service"""
+    global web_shutdown, web_task
     try:
         # 获取环境变量
         mode = os.environ.get('MODE', 'dev')
@@ -156,29 +156,43 @@ async def start_web_service():
         
         logger.info(f"Starting web service in {mode} mode on port {port}")
         
-        # Create the Flask app
-        app = Flask(__name__, 
+        # Create the Quart app，与TelegramCore运行在同一个事件循环上
+        app = Quart(__name__, 
                    template_folder='templates',
                    static_folder='static',
                    static_url_path='')
         
         # Set CORS policy
-        CORS(app)
+        @app.after_request
+        async def add_cors_headers(response):
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Idempotency-Key, Prefer'
+            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, DELETE, OPTIONS'
+            return response
         
         # Init web routes
         from web_routes import init_web_routes, set_main_loop
-        set_main_loop(asyncio.get_event_loop())
-        init_web_routes(app, telegram_client)
+        set_main_loop(asyncio.get_running_loop())
+        init_web_routes(
+            app, telegram_client,
+            bot_service.telegram_api if bot_service else None,
+            bot_service.recurring if bot_service else None,
+            bot_service.twitter_api if bot_service else None
+        )
         
-        # Run the app
-        web_thread = threading.Thread(target=app.run, kwargs={
-            'host': '0.0.0.0',
-            'port': port,
-            'debug': False,
-            'use_reloader': False
-        })
-        web_thread.daemon = True
-        web_thread.start()
+        # Run the app with the ASGI server as a task on the current loop
+        web_shutdown = asyncio.Event()
+        config = HypercornConfig()
+        config.bind = [f"0.0.0.0:{port}"]
+        config.accesslog = None
+        web_task = asyncio.get_running_loop().create_task(
+            serve(app, config, shutdown_trigger=web_shutdown.wait)
+        )
+        
+        # 等待绑定端口，启动失败时立即返回
+        await asyncio.sleep(0.5)
+        if web_task.done():
+            web_task.result()
         
         logger.info(f"Web service started on port {port}")
         return True
@@ -220,8 +234,9 @@ def main():
         logger.info(f"Twitter API service status - is_running: {service.twitter_api.is_running}")
             
         # 设置全局变量让其他模块可以访问
-        global telegram_client
+        global telegram_client, bot_service
         telegram_client = service.telegram_core.client
+        bot_service = service
             
         # 启动 Web 服务
         if not loop.run_until_complete(start_web_service()):
@@ -231,20 +246,34 @@ def main():
         logger.info("All services started successfully")
         logger.info(f"Bot version: {VERSION}")
         
+        # systemd 和 stop-service.sh 用 SIGTERM 停止服务：停止事件循环，执行下面的清理（会话快照、写入peer存储、日志）
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, loop.stop)
+        
         # 运行事件循环
         try:
             loop.run_forever()
         except KeyboardInterrupt:
             logger.info("Received keyboard interrupt, stopping...")
         finally:
+            logger.info("Event loop stopped, shutting down services...")
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(sig)
             # 停止服务
+            if web_shutdown:
+                web_shutdown.set()
+                loop.run_until_complete(web_task)
             loop.run_until_complete(service.stop())
             # 关闭事件循环
             loop.close()
             
     except Exception as e:
         logger.error(f"Error in main: {e}", exc_info=True)
+        stop_logging()
         sys.exit(1)
+    finally:
+        # 等待后台日志线程写完剩余的记录
+        stop_logging()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
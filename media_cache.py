@@ -0,0 +1,177 @@
+import logging
+import os
+import time
+import base64
+import hashlib
+from io import BytesIO
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# 图片文件头，用于在保存定时任务前校验图片
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+def image_type(data):
+    """Return the image extension (jpg, png, gif, webp, bmp) of raw bytes, or None"""
+    head = bytes(data[:12])
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+async def load_image(http, image_data=None, image_url=None):
+    """Decode a base64 data URI or download an image URL, return (bytes, file_name)"""
+    if image_data:
+        # 移除data URI前缀
+        image_bytes = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
+        return image_bytes, 'image.jpg'
+    if image_url:
+        image_bytes = await http.fetch(image_url)
+        return image_bytes, os.path.basename(urlparse(image_url).path) or 'image.jpg'
+    return None, None
+
+async def read_image(http, image_data=None, image_url=None, image_file=None):
+    """Return (bytes, file_name) of a validated image, or (None, None) if there is none.
+
+    Used for scheduled sends: the image is read, downloaded or decoded now
+    so a broken image fails the request instead of the send at the due
+    time. Raises ValueError for data that is not a known image format.
+    """
+    if image_file is not None:
+        image_file.seek(0)
+        blob, name = image_file.read(), getattr(image_file, 'name', None) or 'image.jpg'
+    else:
+        blob, name = await load_image(http, image_data, image_url)
+    if blob is None:
+        return None, None
+    extension = image_type(blob)
+    if not extension:
+        raise ValueError('Unsupported image format')
+    # 没有扩展名时按文件头补上
+    return blob, name if os.path.splitext(name)[1] else f"image.{extension}"
+
+def named_image(blob, name=None):
+    """Wrap image bytes in a named BytesIO for upload"""
+    file = BytesIO(blob)
+    file.name = name or 'image.jpg'
+    return file
+
+class MediaCache:
+    """Bounded LRU cache of already uploaded media, keyed by content hash or image URL.
+
+    Several keys may point at the same entry (e.g. the image URL and the
+    SHA-256 of the downloaded bytes), so a hit on either avoids a re-upload.
+    """
+
+    def __init__(self, max_size=512, ttl=86400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, media, size)
+        self.hits = 0
+        self.misses = 0
+        self.uploads = 0
+        self.bytes_saved = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def content_key(data):
+        """Key for raw image bytes, a BytesIO or a seekable file object"""
+        if hasattr(data, 'getvalue'):
+            data = data.getvalue()
+        if isinstance(data, (bytes, bytearray)):
+            return 'sha256:' + hashlib.sha256(data).hexdigest()
+        if hasattr(data, 'read') and hasattr(data, 'seek'):
+            # 分块计算哈希，不把整个文件读入内存
+            digest = hashlib.sha256()
+            position = data.tell()
+            data.seek(0)
+            for chunk in iter(lambda: data.read(64 * 1024), b''):
+                digest.update(chunk)
+            data.seek(position)
+            return 'sha256:' + digest.hexdigest()
+        return None
+
+    @staticmethod
+    def url_key(url):
+        """Key for an image URL: lower-case scheme/host, no default port or fragment, sorted query"""
+        if not url:
+            return None
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or '').lower()
+        if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+            host = f"{host}:{parts.port}"
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return 'url:' + urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, *keys):
+        """Return the media stored under the first live key, or None on a miss"""
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            expires_at, media, size = entry
+            if expires_at <= now:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += size
+            return media
+        self.misses += 1
+        return None
+
+    def set(self, keys, media, size=0, ttl=None):
+        """Store uploaded media under every key in keys (ttl overrides the default expiry)"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl))
+        for key in keys:
+            if not key:
+                continue
+            self._entries[key] = (expires_at, media, size)
+            self._entries.move_to_end(key)
+        self.uploads += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def size(self, key):
+        """Size in bytes recorded for key (0 if unknown)"""
+        entry = self._entries.get(key)
+        return entry[2] if entry else 0
+
+    def invalidate(self, *keys):
+        """Drop entries whose file reference is no longer valid"""
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'uploads': self.uploads,
+            'bytes_saved': self.bytes_saved,
+            'invalidations': self.invalidations
+        }
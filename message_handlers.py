@@ -1,15 +1,74 @@
 import logging
+import os
 from telethon import events
+from telethon.utils import get_peer_id
 from datetime import datetime
+from log_setup import LogSampler
+from entity_cache import EntityCache
+from command_router import CommandRouter
+from commands import COMMANDS
 
 logger = logging.getLogger(__name__)
 
 class MessageHandlers:
-    def __init__(self, client, daily_password, target_group):
+    def __init__(self, client, daily_password, target_group, outbox=None, bot_username=None):
         self.client = client
         self.daily_password = daily_password
         self.target_group = target_group
+        self.outbox = outbox  # 发送队列，所有回复都经过限流
+        # 活跃群组中每条消息都写日志会拖慢更新处理，按群组采样
+        self.log_sampler = LogSampler(per_minute=int(os.getenv('LOG_MESSAGES_PER_CHAT_PER_MINUTE', 20)))
+        # 发送者/群组信息缓存：由收到的消息更新，未命中时才请求，用户和群组ID分开存放
+        cache_size = int(os.getenv('TELEGRAM_METADATA_CACHE_SIZE', 2048))
+        cache_ttl = float(os.getenv('TELEGRAM_METADATA_CACHE_TTL', 3600))
+        self.users = EntityCache(max_size=cache_size, ttl=cache_ttl, negative_ttl=0)
+        self.chats = EntityCache(max_size=cache_size, ttl=cache_ttl, negative_ttl=0)
         self.VERSION = "0.23.2"  # 更新版本号
+        # 命令表只在启动时读取，命令模块在第一次使用时才导入
+        self.commands = CommandRouter(COMMANDS, 'commands', bot_username)
+
+    async def reply(self, event, text):
+        """Reply to an event through the rate-limited outbox"""
+        if self.outbox:
+            return await self.outbox.submit(event.chat_id, lambda: event.reply(text))
+        return await event.reply(text)
+
+    def remember(self, event):
+        """Cache the sender and chat entities that arrived with the event (no network)"""
+        sender, chat = getattr(event, 'sender', None), getattr(event, 'chat', None)
+        # min实体缺少access_hash，但名字和标题可用
+        if sender is not None:
+            self.users.set(('id', sender.id), sender)
+        if chat is not None and chat is not sender:
+            self.chats.set(('id', chat.id), chat)
+
+    async def get_sender(self, event):
+        """The event's sender, from the cache; only fetched on a miss"""
+        key = self.users.normalize_key(event.sender_id)
+        sender = self.users.get(key) if key else None
+        if sender is None:
+            sender = await event.get_sender()
+            if sender is not None:
+                self.users.set(('id', sender.id), sender)
+        return sender
+
+    async def get_chat(self, event):
+        """The event's chat, from the cache; only fetched on a miss"""
+        key = self.chats.normalize_key(event.chat_id)
+        chat = self.chats.get(key) if key else None
+        if chat is None:
+            chat = await event.get_chat()
+            if chat is not None:
+                self.chats.set(('id', chat.id), chat)
+        return chat
+
+    @staticmethod
+    def display_name(entity, default="user"):
+        # 以频道身份发言时发送者是频道，没有first_name
+        return getattr(entity, 'first_name', None) or getattr(entity, 'title', None) or default
+
+    def metadata_stats(self):
+        return {'users': self.users.stats(), 'chats': self.chats.stats()}
 
     async def handle_new_member(self, event):
         """Handle new member joined event"""
@@ -19,7 +78,8 @@ class MessageHandlers:
                 logger.warning("No new member found in event")
                 return
             
-            chat = await event.get_chat()
+            self.remember(event)
+            chat = await self.get_chat(event)
             logger.info(f"New member {new_member.first_name} (ID: {new_member.id}) joined group {chat.title}")
             
             # 永久禁言新成员
@@ -43,7 +103,7 @@ class MessageHandlers:
                     f"Today's password is: {self.daily_password}\n"
                     "Please send the password to the bot in private chat to unmute."
                 )
-                await event.reply(welcome_message)
+                await self.reply(event, welcome_message)
                 logger.info(f"Sent welcome message to {new_member.first_name}")
                 
             except Exception as e:
@@ -55,36 +115,12 @@ class MessageHandlers:
     async def handle_command(self, event, command):
         """处理命令消息"""
         try:
-            sender = await event.get_sender()
-            username = sender.first_name if sender else "user"
-            
-            if command.lower() == '/hi':
-                await event.reply("Hi, my friends，this is COS72 Bot。")
-            elif command.lower() == '/help':
-                help_text = (
-                    "Available commands:\n"
-                    "/start - Start the bot\n"
-                    "/help - Show this help message\n"
-                    "/hi - Say hello\n"
-                    "/content - Content management\n"
-                    "/price - Price information\n"
-                    "/event - Event management\n"
-                    "/task - Task management\n"
-                    "/news - News updates\n"
-                    "/PNTs - PNTs information\n"
-                    "/account - Account management\n"
-                    "/version - Show bot version"
-                )
-                await event.reply(help_text)
-            elif command.lower() == '/pass':
-                if event.is_private:
-                    await event.reply(f"今日密码：{self.daily_password}")
-                else:
-                    await event.reply("请私聊机器人获取密码。")
-            elif command.lower() == '/version':
-                await event.reply(f"Bot version: {self.VERSION}")
-            else:
-                await event.reply(f"Hi {username}, you invoke function: {command[1:]}")
+            handled = await self.commands.dispatch(self, event, command)
+            if handled is False:
+                # 未注册的命令（回复解析后的命令名，不含@机器人后缀）
+                name, _ = self.commands.parse(command)
+                username = self.display_name(await self.get_sender(event))
+                await self.reply(event, f"Hi {username}, you invoke function: {name}")
                 
         except Exception as e:
             logger.error(f"Error handling command: {str(e)}")
@@ -92,11 +128,10 @@ class MessageHandlers:
     async def handle_mention(self, event):
         """处理 @ 提及消息"""
         try:
-            sender = await event.get_sender()
-            username = sender.first_name if sender else "user"
+            username = self.display_name(await self.get_sender(event))
             message_text = event.message.text
             
-            await event.reply(f"Hi, dear {username}, I got your message: {message_text}")
+            await self.reply(event, f"Hi, dear {username}, I got your message: {message_text}")
             
         except Exception as e:
             logger.error(f"Error handling mention: {str(e)}")
@@ -104,7 +139,7 @@ class MessageHandlers:
     async def handle_private_message(self, event):
         """处理私聊消息"""
         try:
-            sender = await event.get_sender()
+            self.remember(event)
             message_text = event.message.text
             
             # 检查是否是解禁密码
@@ -115,7 +150,7 @@ class MessageHandlers:
                         # 解除禁言
                         await self.client.edit_permissions(
                             self.target_group,
-                            sender.id,
+                            event.sender_id,
                             until_date=None,
                             send_messages=True,
                             send_media=True,
@@ -123,15 +158,16 @@ class MessageHandlers:
                             send_gifs=True,
                             send_games=True
                         )
-                        await event.reply("Password correct! You have been unmuted.")
-                        logger.info(f"Successfully unmuted user {sender.first_name} in group {self.target_group}")
+                        await self.reply(event, "Password correct! You have been unmuted.")
+                        sender = await self.get_sender(event)
+                        logger.info(f"Successfully unmuted user {self.display_name(sender)} in group {self.target_group}")
                     except Exception as e:
                         logger.error(f"Error unmuting user in group {self.target_group}: {str(e)}")
-                        await event.reply("Failed to unmute, please contact admin.")
+                        await self.reply(event, "Failed to unmute, please contact admin.")
                 else:
-                    await event.reply("Target group not set, please contact admin.")
+                    await self.reply(event, "Target group not set, please contact admin.")
             else:
-                await event.reply("Incorrect password, please try again.")
+                await self.reply(event, "Incorrect password, please try again.")
                 
         except Exception as e:
             logger.error(f"Error handling private message: {str(e)}")
@@ -141,22 +177,24 @@ class MessageHandlers:
         try:
             # 获取消息信息
             message_text = event.message.text
-            sender = await event.get_sender()
-            username = sender.first_name if sender else "user"
-            chat = await event.get_chat()
-            chat_title = chat.title if chat else "unknown chat"
+            self.remember(event)
             
-            # 记录所有消息
-            logger.info(f"Message from {username} in {chat_title}: {message_text}")
+            # 记录消息（按群组采样）
+            allowed, suppressed = self.log_sampler.allow(event.chat_id)
+            if allowed:
+                username = self.display_name(await self.get_sender(event))
+                chat_title = self.display_name(await self.get_chat(event), "unknown chat")
+                skipped = f" ({suppressed} messages not logged)" if suppressed else ""
+                logger.info(f"Message from {username} in {chat_title}: {message_text}{skipped}")
+            
+            # 处理命令（/help@机器人名 也会带 mentioned 标志，先按命令处理）
+            if message_text.startswith('/'):
+                await self.handle_command(event, message_text)
+                return
             
             # 处理 @ 提及
             if hasattr(event.message, 'mentioned') and event.message.mentioned:
                 await self.handle_mention(event)
-                return
-            
-            # 处理命令
-            if message_text.startswith('/'):
-                await self.handle_command(event, message_text)
                 
         except Exception as e:
             logger.error(f"Error handling message: {str(e)}")
@@ -170,7 +208,12 @@ class MessageHandlers:
                     f"Today's password is: {self.daily_password}\n"
                     "New members will be muted, please send the password to the bot in private chat to unmute."
                 )
-                await self.client.send_message(self.target_group, message)
+                # 按peer ID排队，与同一群组的其他发送共用限流
+                group = await self.client.get_input_entity(self.target_group)
+                if self.outbox:
+                    await self.outbox.submit(get_peer_id(group), lambda: self.client.send_message(group, message))
+                else:
+                    await self.client.send_message(group, message)
                 logger.info("Online message sent successfully")
         except Exception as e:
             logger.error(f"Error sending online message: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,209 @@
+import logging
+import os
+import sqlite3
+import time
+import asyncio
+from telethon.tl.types import Channel, ChatPhotoEmpty
+
+logger = logging.getLogger(__name__)
+
+class PeerStore:
+    """Persistent map of channel ID/username to access hash, title and forum flag"""
+
+    def __init__(self, path='sessions/peers.db', flush_interval=30, batch_size=100):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._peers = {}  # channel_id -> record
+        self._usernames = {}  # username -> channel_id
+        self._dirty = {}  # channel_id -> record，None 表示删除
+        self._dirty_event = None
+        self._flush_task = None
+        self.hits = 0
+        self.writes = 0
+
+    async def start(self):
+        """Load stored peers into memory and start the write-back task"""
+        loop = asyncio.get_running_loop()
+        records = await loop.run_in_executor(None, self._load)
+        for record in records:
+            self._index(record)
+        logger.info(f"Loaded {len(records)} peers from {self.path}")
+
+        self._dirty_event = asyncio.Event()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Stop the write-back task and flush pending changes"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    def get(self, key):
+        """Return the stored record for a normalized cache key"""
+        if not key:
+            return None
+        kind, value = key
+        if kind == 'username':
+            value = self._usernames.get(value)
+        record = self._peers.get(value)
+        if record:
+            self.hits += 1
+        return record
+
+    def get_entity(self, key):
+        """Build an offline Channel entity from a stored record"""
+        record = self.get(key)
+        if not record:
+            return None
+        return Channel(
+            id=record['id'],
+            title=record['title'] or '',
+            photo=ChatPhotoEmpty(),
+            date=None,
+            megagroup=record['megagroup'],
+            forum=record['forum'],
+            access_hash=record['access_hash'],
+            username=record['username']
+        )
+
+    def remember(self, entity):
+        """Record a resolved channel entity"""
+        if not isinstance(entity, Channel) or entity.min or not entity.access_hash:
+            return
+        record = {
+            'id': entity.id,
+            'access_hash': entity.access_hash,
+            'username': entity.username.lower() if entity.username else None,
+            'title': entity.title,
+            'megagroup': bool(entity.megagroup),
+            'forum': bool(entity.forum),
+            'updated_at': time.time()
+        }
+        old = self._peers.get(entity.id)
+        if old and all(old[k] == record[k] for k in record if k != 'updated_at'):
+            return
+        if old and old['username'] and old['username'] != record['username']:
+            self._usernames.pop(old['username'], None)
+        self._index(record)
+        self._mark_dirty(entity.id, record)
+
+    def forget(self, channel_id):
+        """Remove a channel whose access hash is no longer valid"""
+        record = self._peers.pop(channel_id, None)
+        if not record:
+            return
+        if record['username']:
+            self._usernames.pop(record['username'], None)
+        self._mark_dirty(channel_id, None)
+
+    async def flush(self):
+        """Write pending changes to disk in one batch"""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._write, batch)
+            self.writes += 1
+            logger.debug(f"Flushed {len(batch)} peers to {self.path}")
+        except Exception as e:
+            logger.error(f"Error flushing peer store: {e}")
+            # 写入失败时放回队列，下次再试（较新的修改优先）
+            batch.update(self._dirty)
+            self._dirty = batch
+
+    def stats(self):
+        return {
+            'peers': len(self._peers),
+            'hits': self.hits,
+            'pending_writes': len(self._dirty),
+            'flushes': self.writes
+        }
+
+    def _index(self, record):
+        self._peers[record['id']] = record
+        if record['username']:
+            self._usernames[record['username']] = record['id']
+
+    def _mark_dirty(self, channel_id, record):
+        self._dirty[channel_id] = record
+        if self._dirty_event:
+            self._dirty_event.set()
+
+    async def _flush_loop(self):
+        """Flush dirty peers in batches, only waking when there is something to write"""
+        while True:
+            await self._dirty_event.wait()
+            # 收集一段时间内的修改再统一写入，攒够一批则立即写入
+            try:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._dirty) < self.batch_size and time.monotonic() < deadline:
+                    self._dirty_event.clear()
+                    try:
+                        await asyncio.wait_for(self._dirty_event.wait(), deadline - time.monotonic())
+                    except asyncio.TimeoutError:
+                        break
+            finally:
+                self._dirty_event.clear()
+            await self.flush()
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS peers ('
+            'id INTEGER PRIMARY KEY, access_hash INTEGER NOT NULL, username TEXT, '
+            'title TEXT, megagroup INTEGER, forum INTEGER, updated_at REAL)'
+        )
+        return conn
+
+    def _load(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT id, access_hash, username, title, megagroup, forum, updated_at FROM peers'
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                'id': row[0],
+                'access_hash': row[1],
+                'username': row[2],
+                'title': row[3],
+                'megagroup': bool(row[4]),
+                'forum': bool(row[5]),
+                'updated_at': row[6]
+            }
+            for row in rows
+        ]
+
+    def _write(self, batch):
+        upserts = [
+            (r['id'], r['access_hash'], r['username'], r['title'], int(r['megagroup']), int(r['forum']), r['updated_at'])
+            for r in batch.values() if r
+        ]
+        deletes = [(channel_id,) for channel_id, r in batch.items() if r is None]
+        conn = self._connect()
+        try:
+            with conn:
+                if upserts:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO peers '
+                        '(id, access_hash, username, title, megagroup, forum, updated_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        upserts
+                    )
+                if deletes:
+                    conn.executemany('DELETE FROM peers WHERE id = ?', deletes)
+        finally:
+            conn.close()
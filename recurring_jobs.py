@@ -0,0 +1,88 @@
+import logging
+import time
+from datetime import datetime
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+logger = logging.getLogger(__name__)
+
+class RecurringJobs:
+    """Cron-style recurring jobs (password rotation, periodic posts, maintenance).
+
+    Backed by APScheduler's AsyncIOScheduler on the bot's event loop: each
+    crontab expression is evaluated to its exact next fire time and the
+    loop is only woken at that deadline.
+    """
+
+    def __init__(self, timezone=None, misfire_grace=300):
+        self.timezone = timezone
+        # 错过的多次执行只补一次，同一任务不并发执行
+        self._scheduler = AsyncIOScheduler(
+            timezone=timezone,
+            job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': misfire_grace}
+        )
+        self._jobs = {}  # name -> 运行统计
+
+    def add(self, name, cron, func, description=''):
+        """Register func (a coroutine function) to run on a crontab expression like '0 */3 * * *'"""
+        if not cron:
+            logger.info(f"Recurring job {name} disabled (no cron expression)")
+            return False
+        trigger = CronTrigger.from_crontab(cron, timezone=self.timezone)
+        self._jobs[name] = {
+            'cron': cron,
+            'description': description,
+            'runs': 0,
+            'failures': 0,
+            'last_run': None,
+            'last_duration': None,
+            'last_error': None
+        }
+        self._scheduler.add_job(self._run, trigger, args=(name, func), id=name, name=name, replace_existing=True)
+        logger.info(f"Recurring job {name} registered ({cron})")
+        return True
+
+    async def run_now(self, name):
+        """Run a registered job immediately, outside its schedule"""
+        job = self._scheduler.get_job(name)
+        if not job:
+            return False
+        await self._run(*job.args)
+        return True
+
+    @property
+    def is_running(self):
+        return self._scheduler.running
+
+    def start(self):
+        if not self._scheduler.running:
+            self._scheduler.start()
+            logger.info(f"Recurring jobs started: {', '.join(self._jobs) or 'none'}")
+
+    def stop(self):
+        if self._scheduler.running:
+            self._scheduler.shutdown(wait=False)
+
+    def jobs(self):
+        """Registered jobs with their next fire time and last outcome"""
+        result = []
+        for name, info in self._jobs.items():
+            job = self._scheduler.get_job(name)
+            next_run = job.next_run_time if job else None
+            result.append(dict(info, name=name, next_run=next_run.isoformat() if next_run else None))
+        return result
+
+    async def _run(self, name, func):
+        info = self._jobs[name]
+        start = time.monotonic()
+        info['last_run'] = datetime.now().isoformat()
+        try:
+            await func()
+            info['last_error'] = None
+        except Exception as e:
+            info['failures'] += 1
+            info['last_error'] = str(e)
+            logger.error(f"Recurring job {name} failed: {e}", exc_info=True)
+        finally:
+            info['runs'] += 1
+            info['last_duration'] = round(time.monotonic() - start, 3)
@@ -0,0 +1,220 @@
+import logging
+import os
+import json
+import sqlite3
+import time
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('id', 'kind', 'status', 'due_at', 'created_at', 'fired_at', 'attempts', 'payload', 'result', 'error')
+
+class ScheduleStore:
+    """SQLite (WAL) table of scheduled jobs and their outcome"""
+
+    def __init__(self, path='sessions/schedule.db'):
+        self.path = path
+        self._initialized = False
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def add(self, job, blob=None):
+        await self._run(self._add, job, blob)
+
+    async def get(self, job_id):
+        return await self._run(self._get, job_id)
+
+    async def get_blob(self, job_id):
+        return await self._run(self._get_blob, job_id)
+
+    async def pending(self):
+        """Return (job_id, kind, due_at) for every pending job, without payloads"""
+        return await self._run(self._pending)
+
+    async def claim(self, job_ids):
+        """Mark the given jobs running (if still pending) and return them with payloads"""
+        return await self._run(self._claim, job_ids)
+
+    async def list(self, kind=None, status=None, limit=100):
+        """Return the most recently due jobs, newest first (without image data)"""
+        return await self._run(self._list, kind, status, limit)
+
+    async def cancel(self, job_id):
+        """Cancel a pending job; return False if it is unknown or already running/finished"""
+        return await self._run(self._cancel, job_id)
+
+    async def finish(self, job_id, status, result=None, error=None):
+        await self._run(self._finish, job_id, status, result, error)
+
+    async def purge(self, before):
+        """Delete finished jobs (sent/failed/skipped/cancelled) that fired before the given timestamp"""
+        return await self._run(self._purge, before)
+
+    async def counts(self):
+        """Return the number of jobs per status"""
+        return await self._run(self._counts)
+
+    async def recover(self):
+        """Return jobs left running by a crash to pending (at-least-once delivery)"""
+        return await self._run(self._recover)
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._initialized:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS scheduled_jobs ('
+                'id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, due_at REAL NOT NULL, '
+                'created_at REAL NOT NULL, fired_at REAL, attempts INTEGER DEFAULT 0, '
+                'payload TEXT, result TEXT, error TEXT, blob BLOB)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_due ON scheduled_jobs (status, due_at)')
+            conn.commit()
+            self._initialized = True
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @staticmethod
+    def _row_to_job(row):
+        job = dict(zip(COLUMNS, row))
+        job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _add(self, job, blob):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT INTO scheduled_jobs (id, kind, status, due_at, created_at, payload, blob) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (job['id'], job['kind'], job['status'], job['due_at'], job['created_at'],
+                     json.dumps(job['payload']), blob)
+                )
+        finally:
+            conn.close()
+
+    def _get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM scheduled_jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_job(row) if row else None
+
+    def _get_blob(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT blob FROM scheduled_jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def _pending(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT id, kind, due_at FROM scheduled_jobs WHERE status = 'pending'").fetchall()
+        finally:
+            conn.close()
+
+    def _claim(self, job_ids):
+        conn = self._connect()
+        try:
+            with conn:
+                placeholders = ', '.join('?' * len(job_ids))
+                rows = conn.execute(
+                    f"SELECT {', '.join(COLUMNS)}, blob IS NOT NULL FROM scheduled_jobs "
+                    f"WHERE status = 'pending' AND id IN ({placeholders}) ORDER BY due_at",
+                    list(job_ids)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE scheduled_jobs SET status = 'running', attempts = attempts + 1 WHERE id = ?",
+                    [(row[0],) for row in rows]
+                )
+        finally:
+            conn.close()
+        jobs = []
+        for row in rows:
+            job = self._row_to_job(row[:-1])
+            job['has_blob'] = bool(row[-1])
+            jobs.append(job)
+        return jobs
+
+    def _list(self, kind, status, limit):
+        conditions, params = [], []
+        if kind:
+            conditions.append('kind = ?')
+            params.append(kind)
+        if status:
+            conditions.append('status = ?')
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM scheduled_jobs {where}ORDER BY due_at DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_job(row) for row in rows]
+
+    def _cancel(self, job_id):
+        conn = self._connect()
+        try:
+            with conn:
+                count = conn.execute(
+                    "UPDATE scheduled_jobs SET status = 'cancelled', fired_at = ?, blob = NULL "
+                    "WHERE id = ? AND status = 'pending'",
+                    (time.time(), job_id)
+                ).rowcount
+        finally:
+            conn.close()
+        return count > 0
+
+    def _finish(self, job_id, status, result, error):
+        conn = self._connect()
+        try:
+            with conn:
+                # 已完成的任务不再需要图片数据
+                conn.execute(
+                    'UPDATE scheduled_jobs SET status = ?, fired_at = ?, result = ?, error = ?, blob = NULL WHERE id = ?',
+                    (status, time.time(), json.dumps(result) if result is not None else None, error, job_id)
+                )
+        finally:
+            conn.close()
+
+    def _recover(self):
+        conn = self._connect()
+        try:
+            with conn:
+                count = conn.execute(
+                    "UPDATE scheduled_jobs SET status = 'pending' WHERE status = 'running'"
+                ).rowcount
+        finally:
+            conn.close()
+        return count
+
+    def _purge(self, before):
+        conn = self._connect()
+        try:
+            with conn:
+                count = conn.execute(
+                    "DELETE FROM scheduled_jobs WHERE status NOT IN ('pending', 'running') AND fired_at < ?",
+                    (before,)
+                ).rowcount
+        finally:
+            conn.close()
+        return count
+
+    def _counts(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT status, COUNT(*) FROM scheduled_jobs GROUP BY status').fetchall()
+        finally:
+            conn.close()
+        return dict(rows)
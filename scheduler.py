@@ -0,0 +1,236 @@
+import logging
+import time
+import uuid
+import heapq
+import asyncio
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MISSED_POLICIES = ('send', 'skip', 'window')
+
+class Scheduler:
+    """Single dispatcher for persisted scheduled jobs.
+
+    Jobs are stored in a ScheduleStore and survive restarts. In memory the
+    dispatcher only keeps a min-heap of (monotonic deadline, job ID); the
+    payload is loaded from the store when the job fires. Handlers are
+    registered per kind and called as handler(payload, blob) at the due
+    time; they return a result dict ({'error': ...} marks a failure).
+    An optional prepare(payload, blob) hook runs prepare_lead seconds
+    before the due time (e.g. to upload media) so that only the final
+    send is left when the job fires.
+    """
+
+    def __init__(self, store, missed_policy='send', missed_window=600, grace=60, batch_size=50, prepare_lead=120):
+        if missed_policy not in MISSED_POLICIES:
+            raise ValueError(f"Unknown missed job policy: {missed_policy}")
+        self.store = store
+        self.missed_policy = missed_policy  # send: 迟到也发送；skip: 跳过；window: 迟到不超过missed_window秒才发送
+        self.missed_window = missed_window
+        self.grace = grace  # 迟到不超过grace秒不算错过
+        self.batch_size = batch_size
+        self.prepare_lead = prepare_lead  # 到期前多少秒执行prepare
+        self._handlers = {}
+        self._preparers = {}
+        self._heap = []  # (monotonic deadline, job_id, fire deadline)：fire deadline不为None时先执行prepare
+        self._wake = None
+        self._task = None
+        self._running = set()
+        self.fired = 0
+        self.failed = 0
+        self.skipped = 0
+        self.prepared = 0
+
+    def register(self, kind, handler, prepare=None):
+        self._handlers[kind] = handler
+        if prepare:
+            self._preparers[kind] = prepare
+
+    @property
+    def is_running(self):
+        return self._task is not None
+
+    async def start(self):
+        """Recover interrupted jobs and start the dispatcher"""
+        if self._task:
+            return
+        recovered = await self.store.recover()
+        if recovered:
+            logger.warning(f"{recovered} scheduled jobs were interrupted and will run again")
+        self._heap = [self._entry(job_id, kind, due_at) for job_id, kind, due_at in await self.store.pending()]
+        heapq.heapify(self._heap)
+        logger.info(f"Loaded {len(self._heap)} pending scheduled jobs")
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._dispatch_loop())
+        logger.info(f"Scheduler started (missed job policy: {self.missed_policy})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def schedule(self, kind, due_at, payload, blob=None):
+        """Persist a job due at due_at (datetime or unix timestamp) and return it"""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for {kind}")
+        if isinstance(due_at, datetime):
+            due_at = due_at.timestamp()
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': 'pending',
+            'due_at': due_at,
+            'created_at': time.time(),
+            'payload': payload
+        }
+        await self.store.add(job, blob)
+        self._push(self._entry(job['id'], kind, due_at))
+        logger.info(f"Scheduled job {job['id']} ({kind}) for {datetime.fromtimestamp(due_at).isoformat()}")
+        return job
+
+    async def cancel(self, job_id):
+        """Cancel a pending job; return False if it already ran or does not exist"""
+        cancelled = await self.store.cancel(job_id)
+        if cancelled:
+            # 取消很少发生，直接重建堆
+            self._heap = [entry for entry in self._heap if entry[1] != job_id]
+            heapq.heapify(self._heap)
+            logger.info(f"Cancelled scheduled job {job_id}")
+        return cancelled
+
+    async def jobs(self, kind=None, status=None, limit=100):
+        return await self.store.list(kind, status, limit)
+
+    async def get(self, job_id):
+        return await self.store.get(job_id)
+
+    async def purge(self, retention):
+        """Delete finished jobs older than retention seconds"""
+        count = await self.store.purge(time.time() - retention)
+        if count:
+            logger.info(f"Purged {count} finished scheduled jobs")
+        return count
+
+    async def stats(self):
+        return {
+            'running': self.is_running,
+            'missed_policy': self.missed_policy,
+            'fired': self.fired,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'prepared': self.prepared,
+            'queued': len(self._heap),
+            'jobs': await self.store.counts()
+        }
+
+    @staticmethod
+    def _deadline(due_at):
+        """Convert a wall-clock due time to a monotonic deadline"""
+        return time.monotonic() + (due_at - time.time())
+
+    def _entry(self, job_id, kind, due_at):
+        """Heap entry for a job: its prepare deadline first if the kind has a prepare hook"""
+        deadline = self._deadline(due_at)
+        if kind in self._preparers:
+            return (deadline - self.prepare_lead, job_id, deadline)
+        return (deadline, job_id, None)
+
+    def _push(self, entry):
+        heapq.heappush(self._heap, entry)
+        # 新任务比当前等待的任务更早到期时唤醒调度循环
+        if self._wake and self._heap[0] is entry:
+            self._wake.set()
+
+    def _track(self, coro):
+        task = asyncio.create_task(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _dispatch_loop(self):
+        while True:
+            try:
+                self._wake.clear()
+                delay = self._heap[0][0] - time.monotonic() if self._heap else None
+                if delay is None or delay > 0:
+                    # 只在堆顶任务到期或有更早的新任务时醒来
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                now = time.monotonic()
+                due = []
+                while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                    entry = heapq.heappop(self._heap)
+                    deadline, job_id, fire_deadline = entry
+                    if fire_deadline is None:
+                        due.append(entry)
+                    else:
+                        # 先执行prepare，到期时再发送
+                        heapq.heappush(self._heap, (fire_deadline, job_id, None))
+                        self._track(self._prepare(job_id))
+                # 已取消或已执行的任务不会被领取
+                try:
+                    claimed = await self.store.claim([job_id for _, job_id, _ in due])
+                except Exception:
+                    # 领取失败（如数据库被锁）时放回堆中，稍后重试
+                    for entry in due:
+                        heapq.heappush(self._heap, entry)
+                    raise
+                for job in claimed:
+                    self._track(self._fire(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in scheduler loop: {e}", exc_info=True)
+                await asyncio.sleep(5)
+
+    def _is_missed(self, lateness):
+        if lateness <= self.grace or self.missed_policy == 'send':
+            return False
+        if self.missed_policy == 'window':
+            return lateness > self.missed_window
+        return True
+
+    async def _prepare(self, job_id):
+        job = await self.store.get(job_id)
+        if not job or job['status'] != 'pending':
+            return
+        try:
+            blob = await self.store.get_blob(job_id)
+            await self._preparers[job['kind']](job['payload'], blob)
+            self.prepared += 1
+        except Exception as e:
+            # prepare失败不影响发送，到期时按正常流程处理
+            logger.warning(f"Preparing scheduled job {job_id} ({job['kind']}) failed: {e}")
+
+    async def _fire(self, job):
+        lateness = time.time() - job['due_at']
+        if self._is_missed(lateness):
+            self.skipped += 1
+            logger.warning(f"Skipping scheduled job {job['id']} ({job['kind']}), {lateness:.0f}s late")
+            await self.store.finish(job['id'], 'skipped', error=f"Missed by {lateness:.0f}s")
+            return
+
+        try:
+            blob = await self.store.get_blob(job['id']) if job.get('has_blob') else None
+            result = await self._handlers[job['kind']](job['payload'], blob)
+            error = result.get('error') if isinstance(result, dict) else None
+        except Exception as e:
+            logger.error(f"Scheduled job {job['id']} failed: {e}", exc_info=True)
+            result, error = None, str(e)
+
+        if error:
+            self.failed += 1
+            await self.store.finish(job['id'], 'failed', result, error)
+        else:
+            self.fired += 1
+            await self.store.finish(job['id'], 'sent', result)
+        logger.info(f"Scheduled job {job['id']} ({job['kind']}) {'failed' if error else 'sent'}, {lateness:.2f}s after due time")
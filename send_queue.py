@@ -0,0 +1,200 @@
+import logging
+import time
+import asyncio
+from telethon.errors import FloodWaitError
+
+logger = logging.getLogger(__name__)
+
+class SendQueueFull(Exception):
+    """Raised when the outbox already holds max_depth pending sends"""
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of blocking"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take one token and return how long to wait before using it"""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def penalize(self, seconds):
+        """Block the bucket for the given number of seconds (e.g. after FloodWait)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    @property
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+class _SendJob:
+    __slots__ = ('chat_key', 'factory', 'future', 'reserved', 'attempts')
+
+    def __init__(self, chat_key, factory, future):
+        self.chat_key = chat_key
+        self.factory = factory
+        self.future = future
+        self.reserved = False
+        self.attempts = 0
+
+class SendQueue:
+    """Central outbox with per-chat and global token buckets and a worker pool"""
+
+    def __init__(self, workers=4, max_depth=1000, chat_rate_per_minute=20, chat_burst=3,
+                 global_rate_per_second=30, max_flood_wait=60, max_retries=2):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.chat_rate = chat_rate_per_minute / 60.0
+        self.chat_burst = chat_burst
+        self.max_flood_wait = max_flood_wait
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate_per_second, global_rate_per_second)
+        self._chat_buckets = {}
+        self._queue = None
+        self._tasks = []
+        self._pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.delayed = 0
+        self.flood_waits = 0
+
+    @property
+    def is_running(self):
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the worker pool on the running loop"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Send queue started with {self.workers} workers")
+
+    async def stop(self):
+        """Stop the workers and fail any sends still waiting"""
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._queue:
+            while not self._queue.empty():
+                job = self._queue.get_nowait()
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("Send queue stopped"))
+        self._pending = 0
+
+    async def submit(self, chat_key, factory):
+        """Queue a send and wait for its result.
+
+        factory is a zero-argument callable returning the coroutine that
+        performs the send; it is only called once a rate-limit slot is free.
+        """
+        if not self._tasks:
+            # 队列未启动时直接发送（如未调用 start 的独立实例）
+            return await factory()
+        if self._pending >= self.max_depth:
+            self.rejected += 1
+            raise SendQueueFull(f"Send queue is full ({self.max_depth} pending)")
+        future = asyncio.get_running_loop().create_future()
+        self._pending += 1
+        self._queue.put_nowait(_SendJob(chat_key, factory, future))
+        return await future
+
+    def stats(self):
+        return {
+            'running': self.is_running,
+            'workers': len(self._tasks),
+            'depth': self._pending,
+            'max_depth': self.max_depth,
+            'sent': self.sent,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'delayed': self.delayed,
+            'flood_waits': self.flood_waits,
+            'chats': len(self._chat_buckets)
+        }
+
+    def _chat_bucket(self, chat_key):
+        bucket = self._chat_buckets.get(chat_key)
+        if bucket is None:
+            # 清理已空闲的桶，避免字典无限增长
+            if len(self._chat_buckets) >= 1000:
+                for key in [k for k, b in self._chat_buckets.items() if b.idle]:
+                    del self._chat_buckets[key]
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_key] = bucket
+        return bucket
+
+    def _requeue(self, job):
+        if self._tasks:
+            self._queue.put_nowait(job)
+        elif not job.future.done():
+            job.future.set_exception(RuntimeError("Send queue stopped"))
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if job.future.done():
+                # 调用方已取消
+                self._pending -= 1
+                continue
+
+            if not job.reserved:
+                job.reserved = True
+                delay = self._chat_bucket(job.chat_key).reserve()
+                if delay > 0:
+                    # 不占用worker等待，到达该群的发送时间后重新入队
+                    self.delayed += 1
+                    loop.call_later(delay, self._requeue, job)
+                    continue
+
+            delay = self.global_bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            job.attempts += 1
+            try:
+                result = await job.factory()
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                logger.warning(f"FloodWait of {e.seconds}s while sending to {job.chat_key}")
+                self._chat_bucket(job.chat_key).penalize(e.seconds)
+                if job.attempts <= self.max_retries and e.seconds <= self.max_flood_wait:
+                    job.reserved = False
+                    loop.call_later(e.seconds, self._requeue, job)
+                    continue
+                self._finish(job, exception=e)
+            except asyncio.CancelledError:
+                self._finish(job, exception=RuntimeError("Send queue stopped"))
+                raise
+            except Exception as e:
+                self._finish(job, exception=e)
+            else:
+                self._finish(job, result=result)
+
+    def _finish(self, job, result=None, exception=None):
+        self._pending -= 1
+        if exception is not None:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(exception)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
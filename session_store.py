@@ -0,0 +1,123 @@
+import logging
+import os
+import json
+import base64
+import asyncio
+from telethon.sessions import MemorySession
+from telethon.crypto import AuthKey
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+class SnapshotSession(MemorySession):
+    """In-memory Telethon session that is snapshotted to a single file.
+
+    The session lives in memory while the client runs, so there is no
+    SQLite write on every update. Snapshots are written to a temporary
+    file and moved into place with an atomic rename.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._dirty = False
+        self.snapshots = 0
+        self._load()
+
+    # Telethon 每分钟及登录后都会调用 save()，这里只标记为脏数据，由快照统一写盘
+    def save(self):
+        self._dirty = True
+
+    def close(self):
+        self.snapshot()
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self._dirty = True
+
+    @MemorySession.auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        self._dirty = True
+
+    def process_entities(self, tlo):
+        count = len(self._entities)
+        super().process_entities(tlo)
+        if len(self._entities) != count:
+            self._dirty = True
+
+    def snapshot(self):
+        """Write the session to disk if it changed since the last snapshot"""
+        if not self._dirty:
+            return False
+        self._write(self._serialize())
+        return True
+
+    async def snapshot_async(self):
+        """Serialize on the loop, write the file in a worker thread"""
+        if not self._dirty:
+            return False
+        data = self._serialize()
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+        return True
+
+    def _serialize(self):
+        self._dirty = False
+        return {
+            'version': SNAPSHOT_VERSION,
+            'dc_id': self._dc_id,
+            'server_address': self._server_address,
+            'port': self._port,
+            'auth_key': base64.b64encode(self._auth_key.key).decode('ascii') if self._auth_key else None,
+            'takeout_id': self._takeout_id,
+            'entities': sorted(self._entities, key=lambda row: row[0])
+        }
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        # 会话文件包含auth key，只允许当前用户读写
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.snapshots += 1
+        except Exception:
+            self._dirty = True
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            logger.info(f"No session snapshot at {self.path}, a new session will be created")
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported session snapshot version: {data.get('version')}")
+            self._dc_id = data['dc_id'] or 0
+            self._server_address = data['server_address']
+            self._port = data['port']
+            if data['auth_key']:
+                self._auth_key = AuthKey(base64.b64decode(data['auth_key']))
+            self._takeout_id = data.get('takeout_id')
+            self._entities = set(tuple(row) for row in data.get('entities', []))
+            logger.info(f"Loaded session snapshot from {self.path} ({len(self._entities)} entities)")
+        except Exception as e:
+            logger.error(f"Error loading session snapshot {self.path}, starting a new session: {e}")
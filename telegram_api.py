@@ -2,26 +2,174 @@ import logging
 import asyncio
 from datetime import datetime
 from telegram_core import TelegramCore
-import base64
-from io import BytesIO
 import time
-import aiohttp
 import re
 import os
-from urllib.parse import urlparse
+from http_session import HttpSession
+from media_cache import MediaCache, load_image, read_image, named_image
+from scheduler import Scheduler
+from schedule_store import ScheduleStore
 
 logger = logging.getLogger(__name__)
 
 class TelegramAPI:
-    def __init__(self, core: TelegramCore = None):
+    def __init__(self, core: TelegramCore = None, http: HttpSession = None, scheduler: Scheduler = None):
         self.core = core or TelegramCore()
+        self.http = http or HttpSession()  # 共享的连接池，由服务生命周期负责关闭
+        self.scheduler = scheduler or Scheduler(ScheduleStore())  # 持久化的定时任务
+        self.scheduler.register('telegram.send_message', self._run_scheduled, prepare=self._prepare_scheduled)
         self.is_running = False
+        self.broadcast_concurrency = int(os.getenv('TELEGRAM_BROADCAST_CONCURRENCY', 5))
+        self.album_max_size = int(os.getenv('TELEGRAM_ALBUM_MAX_SIZE', 10))  # Telegram相册最多10张
 
-    async def send_message(self, message: str, channel: str = None, topic_id: int = None, scheduled_time: str = None, image_data: str = None, image_url: str = None):
-        """发送消息到 Telegram"""
+    @staticmethod
+    def _extract_image_url(image_url: str):
+        """Return the URL from a plain or Markdown ![alt](url) image reference"""
+        # 处理可能的Markdown格式
+        if image_url.startswith('!['):
+            match = re.search(r'\!\[.*?\]\((.*?)\)', image_url)
+            if not match:
+                raise ValueError('Invalid Markdown image format')
+            image_url = match.group(1)
+        return image_url
+
+    async def _prepare_image(self, image_data: str = None, image_url: str = None, image_file=None):
+        """Return (image_key, image_loader) for core.send_message.
+
+        The image is only downloaded/decoded here when it is not already in
+        the media cache; the loader hands out a fresh file object per call
+        and never loads the same image twice. An uploaded image_file is
+        passed through as is, without copying it into memory.
+        """
+        if image_file is not None:
+            async def file_loader():
+                image_file.seek(0)
+                return image_file
+            return MediaCache.content_key(image_file), file_loader
+        if not image_data and not image_url:
+            return None, None
+        image_key = None
+        if image_url and not image_data:
+            image_key = MediaCache.url_key(self._extract_image_url(image_url))
+        loaded = []
+        lock = asyncio.Lock()
+
+        async def loader():
+            async with lock:
+                if not loaded:
+                    loaded.extend(await load_image(self.http, image_data, image_url and self._extract_image_url(image_url)))
+            return named_image(*loaded)
+
+        # 缓存未命中时立即加载，使下载/解码错误直接返回给调用方
+        if not (image_key and image_key in self.core.media_cache):
+            image_file = await loader()
+            image_key = image_key or MediaCache.content_key(image_file)
+        return image_key, loader
+
+    async def broadcast(self, message: str, targets: list, image_data: str = None, image_url: str = None, concurrency: int = None, image_file=None):
+        """Send one message to many (channel, topic_id) targets with bounded concurrency"""
+        try:
+            if not self.core or not self.core.client:
+                logger.error("Telegram client not initialized")
+                return {'error': 'Telegram client not initialized'}
+                
+            # 请求中的并发数不能超过配置的上限
+            limit = self.broadcast_concurrency
+            if concurrency:
+                limit = max(1, min(concurrency, limit))
+            logger.info(f"Broadcasting message to {len(targets)} targets with concurrency {limit}")
+            
+            # 图片只解码/下载一次，所有目标共用；已上传过的图片直接复用
+            try:
+                image_key, image_loader = await self._prepare_image(image_data, image_url, image_file)
+            except Exception as e:
+                logger.error(f"Error loading broadcast image: {e}")
+                return {'error': f'Error processing image: {str(e)}'}
+                
+            semaphore = asyncio.Semaphore(limit)
+            
+            async def send_one(channel, topic_id):
+                async with semaphore:
+                    try:
+                        result = await self.core.send_message(
+                            message=message,
+                            channel_name=channel,
+                            topic_id=topic_id,
+                            image_key=image_key,
+                            image_loader=image_loader
+                        )
+                    except Exception as e:
+                        result = {'error': str(e)}
+                    if 'error' in result:
+                        return {'error': result['error']}
+                    return {'message_id': result['message_id']}
+                    
+            try:
+                results = await asyncio.gather(*(send_one(channel, topic_id) for channel, topic_id in targets))
+            finally:
+                if image_file is not None:
+                    image_file.close()
+            failed = sum(1 for r in results if 'error' in r)
+            logger.info(f"Broadcast finished: {len(results) - failed} sent, {failed} failed")
+            return {'status': 'success', 'results': list(results)}
+            
+        except Exception as e:
+            logger.error(f"Error in broadcast: {e}")
+            import traceback
+            logger.error(f"Stack trace: {traceback.format_exc()}")
+            return {'error': str(e)}
+
+    async def send_album(self, message: str, channel: str = None, topic_id: int = None, images: list = None, image_urls: list = None, image_files: list = None):
+        """Send several images (base64 data, URLs and/or uploaded files) as one album captioned with message"""
+        images, image_urls, image_files = images or [], image_urls or [], image_files or []
+        try:
+            if not self.core or not self.core.client:
+                logger.error("Telegram client not initialized")
+                return {'error': 'Telegram client not initialized'}
+            count = len(images) + len(image_urls) + len(image_files)
+            if not count:
+                return {'error': 'No images provided for album'}
+            if count > self.album_max_size:
+                return {'error': f'An album can contain at most {self.album_max_size} images'}
+            logger.info(f"Sending album of {count} images to channel: {channel}, topic_id: {topic_id}")
+
+            # 所有图片并发下载/解码，已上传过的图片不再下载
+            try:
+                prepared = await asyncio.gather(
+                    *(self._prepare_image(image_data=data) for data in images),
+                    *(self._prepare_image(image_url=url) for url in image_urls),
+                    *(self._prepare_image(image_file=file) for file in image_files)
+                )
+            except Exception as e:
+                logger.error(f"Error loading album images: {e}")
+                return {'error': f'Error processing image: {str(e)}'}
+
+            try:
+                return await self.core.send_message(
+                    message=message,
+                    channel_name=channel,
+                    topic_id=topic_id,
+                    images=list(prepared)
+                )
+            except Exception as e:
+                logger.error(f"Error sending album: {e}")
+                return {'error': str(e)}
+        finally:
+            for image_file in image_files:
+                image_file.close()
+
+    async def send_message(self, message: str, channel: str = None, topic_id: int = None, scheduled_time: str = None, image_data: str = None, image_url: str = None, image_file=None):
+        """发送消息到 Telegram（image_file为上传的文件对象，完成后关闭）"""
+        try:
+            return await self._send_message(message, channel, topic_id, scheduled_time, image_data, image_url, image_file)
+        finally:
+            if image_file is not None:
+                image_file.close()
+
+    async def _send_message(self, message: str, channel: str = None, topic_id: int = None, scheduled_time: str = None, image_data: str = None, image_url: str = None, image_file=None):
         try:
             # 记录请求参数
-            logger.info(f"TelegramAPI.send_message called with params: message={message}, channel={channel}, topic_id={topic_id}, scheduled_time={scheduled_time}, has_image={bool(image_data)}, has_image_url={bool(image_url)}")
+            logger.info(f"TelegramAPI.send_message called with params: message={message}, channel={channel}, topic_id={topic_id}, scheduled_time={scheduled_time}, has_image={bool(image_data or image_file)}, has_image_url={bool(image_url)}")
             
             # 日志记录服务状态
             logger.info(f"Checking service status - core.is_running: {self.core.is_running if self.core else False}, client: {bool(self.core.client if self.core else False)}")
@@ -56,12 +204,18 @@ class TelegramAPI:
                     
                     logger.info(f"Message will be sent in {days} days, {hours} hours, {minutes} minutes")
                     
-                    # 启动定时任务
-                    asyncio.create_task(self._send_message_later(message, channel, topic_id, delay, image_data, image_url))
+                    # 保存为持久化的定时任务，重启后仍会发送；图片现在就下载并校验
+                    try:
+                        payload, blob = await self._scheduled_payload(message, channel, topic_id, image_data, image_url, image_file)
+                    except Exception as e:
+                        logger.error(f"Error processing scheduled image: {e}")
+                        return {'error': f'Error processing image: {str(e)}'}
+                    job = await self.scheduler.schedule('telegram.send_message', scheduled_datetime, payload, blob)
                     
                     # 返回定时发送的状态
                     return {
                         'status': 'scheduled',
+                        'job_id': job['id'],
                         'message': f"Message scheduled to be sent at {scheduled_datetime.isoformat()}",
                         'delay': {
                             'days': days,
@@ -75,44 +229,14 @@ class TelegramAPI:
                     return {'error': f'Invalid scheduled time format: {str(e)}'}
                     
             # 处理即时发送
-            logger.info(f"Sending immediate message to channel: {channel}, topic_id: {topic_id}, has image: {bool(image_data)}, has image URL: {bool(image_url)}")
+            logger.info(f"Sending immediate message to channel: {channel}, topic_id: {topic_id}, has image: {bool(image_data or image_file)}, has image URL: {bool(image_url)}")
             
-            # 处理图片
-            image_file = None
-            if image_data:
-                try:
-                    # 解码Base64图片数据
-                    image_bytes = base64.b64decode(image_data.split(',')[1])
-                    image_file = BytesIO(image_bytes)
-                    image_file.name = 'image.jpg'  # 为文件对象添加名称属性
-                except Exception as e:
-                    logger.error(f"Error processing image data: {e}")
-                    return {'error': f'Error processing image: {str(e)}'}
-            elif image_url:
-                try:
-                    # 处理可能的Markdown格式
-                    if image_url.startswith('!['):
-                        # 从Markdown中提取URL，格式可能是 ![alt](url)
-                        match = re.search(r'\!\[.*?\]\((.*?)\)', image_url)
-                        if match:
-                            image_url = match.group(1)
-                        else:
-                            return {'error': 'Invalid Markdown image format'}
-                            
-                    # 下载图片URL
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(image_url) as resp:
-                            if resp.status != 200:
-                                return {'error': f'Failed to download image from URL: {resp.status}'}
-                            image_bytes = await resp.read()
-                            image_file = BytesIO(image_bytes)
-                            # 从URL中提取文件名
-                            url_path = urlparse(image_url).path
-                            file_name = os.path.basename(url_path) or 'image.jpg'
-                            image_file.name = file_name
-                except Exception as e:
-                    logger.error(f"Error downloading image from URL: {e}")
-                    return {'error': f'Error downloading image: {str(e)}'}
+            # 处理图片（已上传过的图片不再下载）
+            try:
+                image_key, image_loader = await self._prepare_image(image_data, image_url, image_file)
+            except Exception as e:
+                logger.error(f"Error loading image: {e}")
+                return {'error': f'Error processing image: {str(e)}'}
                     
             # 发送消息
             try:
@@ -122,7 +246,8 @@ class TelegramAPI:
                         message=message,
                         channel_name=channel, 
                         topic_id=topic_id, 
-                        image_path=image_file
+                        image_key=image_key,
+                        image_loader=image_loader
                     )
                     return result
                 else:
@@ -138,122 +263,34 @@ class TelegramAPI:
             logger.error(f"Stack trace: {traceback.format_exc()}")
             return {'error': str(e)}
 
-    async def _schedule_message(self, message: str, channel: str, topic_id: int, scheduled_time: str, image_data: str = None, image_url: str = None):
-        """处理定时发送消息的后台任务"""
-        try:
-            # 解析计划时间
-            scheduled_datetime = datetime.fromisoformat(scheduled_time.replace('Z', ''))
-            now = datetime.now()
-            
-            if scheduled_datetime <= now:
-                logger.error("Scheduled time is in the past")
-                return
-            
-            # 计算延迟时间
-            delay = (scheduled_datetime - now).total_seconds()
-            logger.info(f"Scheduling message for {scheduled_datetime} (delay: {delay}s)")
-            
-            # 等待到指定时间
-            await asyncio.sleep(delay)
-            
-            # 添加定时信息到消息中
-            formatted_time = scheduled_datetime.strftime('%Y-%m-%d %H:%M')
-            enhanced_message = f"{message}\n\n[Scheduled message sent at {formatted_time}]"
-            
-            # 发送消息
-            await self._send_message_now(enhanced_message, channel, topic_id, image_data, image_url)
-            
-        except Exception as e:
-            logger.error(f"Error in scheduled message task: {str(e)}")
-            import traceback
-            logger.error(f"Stack trace: {traceback.format_exc()}")
+    async def _scheduled_payload(self, message, channel, topic_id, image_data=None, image_url=None, image_file=None):
+        """Return (payload, image bytes) to persist for a scheduled send"""
+        blob, name = await read_image(self.http, image_data, image_url and self._extract_image_url(image_url), image_file)
+        payload = {'message': message, 'channel': channel, 'topic_id': topic_id, 'image_url': image_url, 'image_name': name}
+        return payload, blob
 
-    async def _send_message_now(self, message: str, channel: str, topic_id: int, image_data: str = None, image_url: str = None):
-        """立即发送消息"""
-        try:
-            if image_data or image_url:
-                # 处理图片
-                import base64
-                from io import BytesIO
-                import time
-                import aiohttp
-                import re
-                
-                try:
-                    image_file = None
-                    
-                    if image_data:
-                        # 处理上传的Base64图片
-                        content_type = image_data.split(';')[0].split(':')[1]
-                        ext = content_type.split('/')[1]  # 获取文件格式 (如 jpeg, png)
-                        file_name = f"image_{int(time.time())}.{ext}"  # 生成文件名
-                        
-                        image_bytes = base64.b64decode(image_data.split(',')[1])
-                        image_file = BytesIO(image_bytes)
-                        image_file.name = file_name  # 设置文件名
-                        
-                        logger.info(f"Sending uploaded image with filename: {file_name}, content-type: {content_type}")
-                    
-                    elif image_url:
-                        # 处理 Markdown 格式的图片 URL
-                        # 匹配 markdown 格式: ![alt text](https://example.com/image.jpg)
-                        markdown_match = re.match(r'!\[(.*?)\]\((.*?)\)', image_url)
-                        if markdown_match:
-                            # 提取真正的 URL
-                            image_url = markdown_match.group(2)
-                            logger.info(f"Extracted URL from Markdown format: {image_url}")
-                        
-                        # 提取文件扩展名
-                        ext = image_url.split('.')[-1].lower()
-                        if '?' in ext:  # 处理URL中可能的查询参数
-                            ext = ext.split('?')[0]
-                        
-                        # 如果扩展名不是常见图片格式，默认使用jpg
-                        if ext not in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                            ext = 'jpg'
-                            
-                        file_name = f"image_{int(time.time())}.{ext}"
-                        
-                        # 下载图片
-                        async with aiohttp.ClientSession() as session:
-                            logger.info(f"Downloading image from URL: {image_url}")
-                            async with session.get(image_url) as response:
-                                if response.status == 200:
-                                    image_bytes = await response.read()
-                                    image_file = BytesIO(image_bytes)
-                                    image_file.name = file_name
-                                    logger.info(f"Successfully downloaded image, size: {len(image_bytes)} bytes")
-                                else:
-                                    logger.error(f"Failed to download image, status code: {response.status}")
-                                    return {"error": f"Failed to download image from URL, status code: {response.status}"}
-                    
-                    # 发送图片和文本
-                    message_id = await self.core.send_message(
-                        message=message,
-                        channel=channel,
-                        topic_id=topic_id,
-                        image_file=image_file
-                    )
-                except Exception as e:
-                    logger.error(f"Error processing image: {str(e)}")
-                    return {"error": f"Error processing image: {str(e)}"}
-            else:
-                # 发送纯文本消息
-                message_id = await self.core.send_message(
-                    message=message,
-                    channel=channel,
-                    topic_id=topic_id
-                )
-            
-            return {
-                "status": "success",
-                "message": "Message sent successfully",
-                "message_id": message_id
-            }
-            
-        except Exception as e:
-            logger.error(f"Error sending message: {str(e)}")
-            return {"error": str(e)}
+    async def _prepare_scheduled(self, payload, blob):
+        """Scheduler prepare hook: upload the image of a telegram.send_message job before it is due"""
+        if not blob or not self.core.client:
+            return
+        image_file = named_image(blob, payload.get('image_name'))
+
+        async def loader():
+            return image_file
+
+        await self.core.preload_media(MediaCache.content_key(image_file), loader)
+
+    async def _run_scheduled(self, payload, blob):
+        """Scheduler handler for telegram.send_message jobs"""
+        image_file = named_image(blob, payload.get('image_name')) if blob else None
+        logger.info(f"Sending scheduled message to channel: {payload['channel']}, topic_id: {payload['topic_id']}")
+        return await self.send_message(
+            message=payload['message'],
+            channel=payload['channel'],
+            topic_id=payload['topic_id'],
+            image_url=None if blob else payload.get('image_url'),
+            image_file=image_file
+        )
 
     async def get_status(self):
         """获取 Telegram 服务状态"""
@@ -264,7 +301,20 @@ class TelegramAPI:
             return {
                 "status": "running",
                 "timestamp": datetime.now().isoformat(),
-                "daily_password": self.core.daily_password
+                "daily_password": self.core.daily_password,
+                "entity_cache": self.core.entity_cache.stats(),
+                "metadata_cache": self.core.message_handlers.metadata_stats() if self.core.message_handlers else None,
+                "update_filter": self.core.update_filter.stats(),
+                "commands": self.core.message_handlers.commands.stats() if self.core.message_handlers else None,
+                "send_queue": self.core.outbox.stats(),
+                "peer_store": self.core.peer_store.stats(),
+                "http": self.http.stats(),
+                "media_cache": self.core.media_cache.stats(),
+                "scheduler": await self.scheduler.stats(),
+                "session": {
+                    "file": self.core.session_file,
+                    "snapshots": self.core.session.snapshots if self.core.session else 0
+                }
             }
             
         except Exception as e:
@@ -281,6 +331,9 @@ class TelegramAPI:
                     logger.error("Failed to start Telegram core service")
                     return False
             
+            # 启动定时任务调度（加载重启前未发送的任务）
+            await self.scheduler.start()
+            
             self.is_running = True
             logger.info("Telegram API service started successfully")
             return True
@@ -293,6 +346,7 @@ class TelegramAPI:
     async def stop(self):
         """停止 Telegram API 服务"""
         try:
+            await self.scheduler.stop()
             await self.core.stop()
             self.is_running = False
             return {"status": "success", "message": "Telegram API service stopped"}
@@ -300,72 +354,3 @@ class TelegramAPI:
         except Exception as e:
             logger.error(f"Error stopping Telegram API service: {str(e)}")
             return {"error": str(e)}
-
-    async def _send_message_later(self, message: str, channel: str, topic_id: int, delay: float, image_data: str = None, image_url: str = None):
-        """在指定延迟后发送消息"""
-        try:
-            logger.info(f"Scheduled message task started with delay of {delay} seconds")
-            
-            # 等待指定的延迟时间
-            await asyncio.sleep(delay)
-            
-            # 处理图片
-            image_file = None
-            if image_data:
-                try:
-                    # 解码Base64图片数据
-                    image_bytes = base64.b64decode(image_data.split(',')[1])
-                    image_file = BytesIO(image_bytes)
-                    image_file.name = 'image.jpg'  # 为文件对象添加名称属性
-                except Exception as e:
-                    logger.error(f"Error processing scheduled image data: {e}")
-                    return
-            elif image_url:
-                try:
-                    # 处理可能的Markdown格式
-                    if image_url.startswith('!['):
-                        # 从Markdown中提取URL，格式可能是 ![alt](url)
-                        match = re.search(r'\!\[.*?\]\((.*?)\)', image_url)
-                        if match:
-                            image_url = match.group(1)
-                        else:
-                            logger.error("Invalid Markdown image format")
-                            return
-                            
-                    # 下载图片URL
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(image_url) as resp:
-                            if resp.status != 200:
-                                logger.error(f"Failed to download image from URL: {resp.status}")
-                                return
-                            image_bytes = await resp.read()
-                            image_file = BytesIO(image_bytes)
-                            # 从URL中提取文件名
-                            url_path = urlparse(image_url).path
-                            file_name = os.path.basename(url_path) or 'image.jpg'
-                            image_file.name = file_name
-                except Exception as e:
-                    logger.error(f"Error downloading scheduled image from URL: {e}")
-                    return
-            
-            logger.info(f"Sending scheduled message to channel: {channel}, topic_id: {topic_id}")
-            
-            # 发送消息
-            if self.core:
-                result = await self.core.send_message(
-                    message=message,
-                    channel_name=channel, 
-                    topic_id=topic_id, 
-                    image_path=image_file
-                )
-                if 'error' in result:
-                    logger.error(f"Error sending scheduled message: {result['error']}")
-                else:
-                    logger.info(f"Scheduled message sent successfully!")
-            else:
-                logger.error("Telegram core not initialized for scheduled message")
-                
-        except Exception as e:
-            logger.error(f"Error in _send_message_later: {e}")
-            import traceback
-            logger.error(f"Stack trace: {traceback.format_exc()}") 
\ No newline at end of file
@@ -1,23 +1,41 @@
 import logging
 import os
 from telethon import TelegramClient, events
-from telethon.tl.types import Message, InputPeerChannel, PeerChannel
-from telethon.errors import ChannelPrivateError
+from telethon.tl.types import Message, InputPeerChannel, PeerChannel, UpdateChannel, InputFile, InputFileBig, InputMediaUploadedPhoto
+from telethon.tl.functions.messages import UploadMediaRequest
+from telethon.utils import resolve_id, get_peer_id
+from telethon.errors import (
+    ChannelPrivateError, ChannelInvalidError, PeerIdInvalidError, ChatIdInvalidError,
+    UsernameNotOccupiedError, UsernameInvalidError,
+    FileReferenceExpiredError, FileReferenceInvalidError, MediaEmptyError,
+    FilePartMissingError, FilePart0MissingError
+)
 from datetime import datetime, timedelta
 import asyncio
 from dotenv import load_dotenv
 import random
 import string
 from message_handlers import MessageHandlers
+from entity_cache import EntityCache
+from peer_store import PeerStore
+from session_store import SnapshotSession
+from send_queue import SendQueue
+from media_cache import MediaCache
+from update_filter import UpdateFilter
 from io import BytesIO
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# 发送时出现这些错误说明缓存的实体已失效
+PEER_ERRORS = (ChannelPrivateError, ChannelInvalidError, PeerIdInvalidError, ChatIdInvalidError)
+# 解析失败后短时间内不再重试的错误（FloodWait等临时错误不缓存）
+NEGATIVE_CACHE_ERRORS = (ChannelPrivateError, UsernameNotOccupiedError, UsernameInvalidError, ValueError)
+# 缓存的媒体引用失效（或预上传的文件分片已过期），需要重新上传
+FILE_REFERENCE_ERRORS = (
+    FileReferenceExpiredError, FileReferenceInvalidError, MediaEmptyError,
+    FilePartMissingError, FilePart0MissingError
+)
+
 class TelegramCore:
     def __init__(self):
         self.api_id = os.getenv('TELEGRAM_API_ID')
@@ -28,9 +46,42 @@ class TelegramCore:
         self.client = None
         self.muted_users = set()  # 记录被禁言的用户ID
         self.daily_password = self.generate_password()  # 生成每日密码
+        self.announce_password = os.getenv('TELEGRAM_ANNOUNCE_PASSWORD', 'true').lower() == 'true'  # 更换密码后是否发到群组
         self.message_handlers = None
         self.group_entity = None  # 缓存群组实体
+        self.entity_cache = EntityCache(
+            max_size=int(os.getenv('TELEGRAM_ENTITY_CACHE_SIZE', 256)),
+            ttl=float(os.getenv('TELEGRAM_ENTITY_CACHE_TTL', 3600)),
+            negative_ttl=float(os.getenv('TELEGRAM_ENTITY_NEGATIVE_TTL', 60))
+        )
+        self._pending_entities = {}  # 正在进行的解析，key -> Task
+        # 普通群聊消息在进入处理器前就被丢弃，只有命令、@提及和受管群组的消息才会处理
+        self.update_filter = UpdateFilter(
+            managed_chats=UpdateFilter.parse_chats(os.getenv('TELEGRAM_MANAGED_CHATS')),
+            enabled=os.getenv('TELEGRAM_UPDATE_PREFILTER', 'true').lower() == 'true'
+        )
+        self.peer_store = PeerStore(
+            path=os.getenv('TELEGRAM_PEER_STORE', 'sessions/peers.db'),
+            flush_interval=float(os.getenv('TELEGRAM_PEER_STORE_FLUSH_INTERVAL', 30))
+        )
         self.is_running = False  # 添加运行状态标志
+        self.session = None
+        self.session_file = os.getenv('TELEGRAM_SESSION_FILE', 'sessions/telegram.session.json')
+        self.snapshot_interval = float(os.getenv('TELEGRAM_SESSION_SNAPSHOT_INTERVAL', 300))
+        self._snapshot_task = None
+        self.outbox = SendQueue(
+            workers=int(os.getenv('TELEGRAM_SEND_WORKERS', 4)),
+            max_depth=int(os.getenv('TELEGRAM_SEND_QUEUE_SIZE', 1000)),
+            chat_rate_per_minute=float(os.getenv('TELEGRAM_CHAT_RATE_PER_MINUTE', 20)),
+            chat_burst=int(os.getenv('TELEGRAM_CHAT_BURST', 3)),
+            global_rate_per_second=float(os.getenv('TELEGRAM_GLOBAL_RATE_PER_SECOND', 30))
+        )
+        self.media_cache = MediaCache(
+            max_size=int(os.getenv('TELEGRAM_MEDIA_CACHE_SIZE', 512)),
+            ttl=float(os.getenv('TELEGRAM_MEDIA_CACHE_TTL', 86400))
+        )
+        self._pending_uploads = {}  # 正在上传的媒体，key -> Future
+        self.preload_ttl = float(os.getenv('TELEGRAM_PRELOAD_TTL', 3600))  # 预上传文件在服务器上的保留时间
         logger.info("TelegramCore initialized")
 
     def generate_password(self):
@@ -40,61 +91,120 @@ class TelegramCore:
 
     async def get_group_entity(self, group_name):
         """Get group entity by name"""
+        if not self.client:
+            logger.error("Client not initialized")
+            return None
+
+        cache_key = self.entity_cache.normalize_key(group_name)
+        if not cache_key:
+            return await self._load_group_entity(group_name, None)
+
+        # 先查缓存，命中则跳过网络解析
+        entity = self.entity_cache.get(cache_key)
+        if entity is not None:
+            logger.debug(f"Entity cache hit for: {group_name}")
+            return entity
+
+        # 最近解析失败过的目标直接返回，避免重复消耗ResolveUsername配额
+        error = self.entity_cache.get_failure(cache_key)
+        if error is not None:
+            logger.warning(f"Skipping resolution of {group_name}, it failed recently: {error}")
+            return None
+
+        # 同一目标的并发请求共享同一次解析
+        task = self._pending_entities.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._load_group_entity(group_name, cache_key))
+            self._pending_entities[cache_key] = task
+            task.add_done_callback(lambda _: self._pending_entities.pop(cache_key, None))
+        else:
+            self.entity_cache.coalesced += 1
+            logger.debug(f"Joining in-flight resolution for: {group_name}")
+        return await asyncio.shield(task)
+
+    async def _load_group_entity(self, group_name, cache_key):
+        """Resolve a group entity and record the outcome in the cache"""
         try:
-            if not self.client:
-                logger.error("Client not initialized")
-                return None
-                
-            logger.info(f"Attempting to get entity for: {group_name}")
-            
-            # 尝试将group_name解析为整数（频道ID）
-            try:
-                if isinstance(group_name, int) or (isinstance(group_name, str) and str(group_name).isdigit()):
-                    # 如果是整数或纯数字，假设它是一个频道ID
-                    channel_id = int(group_name)
-                    logger.info(f"Processing numeric channel ID: {channel_id}")
-                    # 尝试不同的方法获取实体
-                    try:
-                        # 方法1: 使用InputPeerChannel
-                        peer = InputPeerChannel(channel_id=channel_id, access_hash=0)
-                        entity = await self.client.get_entity(peer)
-                        logger.info(f"Got channel entity by InputPeerChannel: {entity.title if hasattr(entity, 'title') else 'Unknown'} (ID: {entity.id})")
-                        return entity
-                    except Exception as e1:
-                        logger.warning(f"Method 1 failed: {e1}")
-                        try:
-                            # 方法2: 使用PeerChannel
-                            peer = PeerChannel(channel_id=channel_id)
-                            entity = await self.client.get_entity(peer)
-                            logger.info(f"Got channel entity by PeerChannel: {entity.title if hasattr(entity, 'title') else 'Unknown'} (ID: {entity.id})")
-                            return entity
-                        except Exception as e2:
-                            logger.warning(f"Method 2 failed: {e2}")
-                            try:
-                                # 方法3: 直接使用ID
-                                entity = await self.client.get_entity(channel_id)
-                                logger.info(f"Got channel entity by direct ID: {entity.title if hasattr(entity, 'title') else 'Unknown'} (ID: {entity.id})")
-                                return entity
-                            except Exception as e3:
-                                logger.error(f"All methods failed for numeric ID {channel_id}: {e3}")
-                                raise
-            except Exception as e:
-                logger.warning(f"Failed to get entity as numeric ID, trying as username: {e}")
-            
-            # 如果不是数字ID或上面的尝试失败，使用普通方式获取
-            group = await self.client.get_entity(group_name)
-            logger.info(f"Got group entity: {group.title} (ID: {group.id})")
-            return group
-        except ChannelPrivateError:
+            # 本地持久化的access hash可以直接构造实体，无需网络请求
+            entity = self.peer_store.get_entity(cache_key)
+            if entity is None:
+                entity = await self._resolve_group_entity(group_name)
+                self.peer_store.remember(entity)
+            if entity is not None and cache_key:
+                self.entity_cache.set(cache_key, entity)
+            return entity
+        except ChannelPrivateError as e:
             logger.error(f"Cannot access private channel: {group_name}. The bot must be a member of the channel.")
+            if cache_key:
+                self.entity_cache.set_failure(cache_key, e)
             return None
-        except ValueError as e:
+        except NEGATIVE_CACHE_ERRORS as e:
             logger.error(f"Error getting group entity: {e}")
+            if cache_key:
+                self.entity_cache.set_failure(cache_key, e)
             return None
         except Exception as e:
             logger.error(f"Error getting group entity: {e}")
             return None
 
+    async def _resolve_group_entity(self, group_name):
+        """Resolve a group entity over the network"""
+        logger.info(f"Attempting to get entity for: {group_name}")
+
+        # 尝试将group_name解析为整数（频道ID）
+        try:
+            if isinstance(group_name, int) or (isinstance(group_name, str) and str(group_name).isdigit()):
+                # 如果是整数或纯数字，假设它是一个频道ID
+                channel_id = int(group_name)
+                logger.info(f"Processing numeric channel ID: {channel_id}")
+                # 尝试不同的方法获取实体
+                try:
+                    # 方法1: 使用InputPeerChannel
+                    peer = InputPeerChannel(channel_id=channel_id, access_hash=0)
+                    entity = await self.client.get_entity(peer)
+                    logger.info(f"Got channel entity by InputPeerChannel: {entity.title if hasattr(entity, 'title') else 'Unknown'} (ID: {entity.id})")
+                    return entity
+                except Exception as e1:
+                    logger.warning(f"Method 1 failed: {e1}")
+                    try:
+                        # 方法2: 使用PeerChannel
+                        peer = PeerChannel(channel_id=channel_id)
+                        entity = await self.client.get_entity(peer)
+                        logger.info(f"Got channel entity by PeerChannel: {entity.title if hasattr(entity, 'title') else 'Unknown'} (ID: {entity.id})")
+                        return entity
+                    except Exception as e2:
+                        logger.warning(f"Method 2 failed: {e2}")
+                        try:
+                            # 方法3: 直接使用ID
+                            entity = await self.client.get_entity(channel_id)
+                            logger.info(f"Got channel entity by direct ID: {entity.title if hasattr(entity, 'title') else 'Unknown'} (ID: {entity.id})")
+                            return entity
+                        except Exception as e3:
+                            logger.error(f"All methods failed for numeric ID {channel_id}: {e3}")
+                            raise
+        except Exception as e:
+            logger.warning(f"Failed to get entity as numeric ID, trying as username: {e}")
+
+        # 如果不是数字ID或上面的尝试失败，使用普通方式获取
+        group = await self.client.get_entity(group_name)
+        logger.info(f"Got group entity: {group.title} (ID: {group.id})")
+        return group
+
+    def invalidate_entity(self, entity_id, channel=None):
+        """Drop the in-memory entity after the channel changed (title, rights, ...).
+
+        The access hash stays valid through such changes, so the persisted
+        peer is kept; it is refreshed from channel when the update carries it.
+        """
+        self.entity_cache.invalidate_id(entity_id)
+        if channel is not None:
+            self.peer_store.remember(channel)
+
+    def forget_entity(self, entity_id):
+        """Drop a cached entity everywhere, e.g. after its access hash stopped working"""
+        self.entity_cache.invalidate_id(entity_id)
+        self.peer_store.forget(entity_id)
+
     async def start(self):
         """Start the Telegram core service"""
         try:
@@ -115,23 +225,37 @@ class TelegramCore:
             if missing_vars:
                 raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
                 
-            # 使用时间戳创建唯一的session文件名
-            current_time = datetime.now().strftime("%Y%m%d%H%M%S")
-            session_file = f"sessions/telegram_session_{current_time}"
-            self.client = TelegramClient(session_file, self.api_id, self.api_hash)
+            # 使用常驻内存的会话，定期快照到磁盘，重启时复用已有授权
+            self.session = SnapshotSession(self.session_file)
+            self.client = TelegramClient(self.session, self.api_id, self.api_hash)
+            
+            # 加载持久化的频道信息，重启后无需重新解析
+            await self.peer_store.start()
             
             await self.client.start(bot_token=self.bot_token)
             logger.info("Telegram client started successfully")
             
+            # 首次登录后立即保存授权信息，之后定期快照
+            await self.session.snapshot_async()
+            if self._snapshot_task is None:
+                self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+            
             # 获取群组实体
             if self.target_group:
                 await self.get_group_entity(self.target_group)
             
+            # 启动发送队列
+            self.outbox.start()
+            
             # 初始化消息处理器
+            # 群组中的 /命令@机器人名 需要知道自己的用户名
+            me = await self.client.get_me()
             self.message_handlers = MessageHandlers(
                 client=self.client,
                 daily_password=self.daily_password,
-                target_group=self.target_group
+                target_group=self.target_group,
+                outbox=self.outbox,
+                bot_username=getattr(me, 'username', None)
             )
             logger.info("Message handlers initialized")
                 
@@ -154,16 +278,25 @@ class TelegramCore:
             # 注册新成员处理器
             @self.client.on(events.ChatAction)
             async def new_member_handler(event):
+                if event.new_title:
+                    self.invalidate_entity(resolve_id(event.chat_id)[0], event.chat)
                 if event.user_joined:
                     await self.message_handlers.handle_new_member(event)
 
+            # 频道信息变化（标题、用户名、权限）时清除实体缓存
+            @self.client.on(events.Raw(types=UpdateChannel))
+            async def channel_update_handler(update):
+                # 更新中通常附带最新的频道实体
+                entities = getattr(update, '_entities', None) or {}
+                self.invalidate_entity(update.channel_id, entities.get(get_peer_id(PeerChannel(update.channel_id))))
+
             # 注册私聊消息处理器
             @self.client.on(events.NewMessage(incoming=True, func=lambda e: e.is_private))
             async def private_message_handler(event):
                 await self.message_handlers.handle_private_message(event)
 
-            # 注册群组消息处理器（排除私聊消息）
-            @self.client.on(events.NewMessage(incoming=True, func=lambda e: not e.is_private))
+            # 注册群组消息处理器（排除私聊消息，普通聊天由预过滤器丢弃）
+            @self.client.on(events.NewMessage(incoming=True, func=self.update_filter))
             async def group_message_handler(event):
                 await self.message_handlers.handle_message(event)
 
@@ -172,8 +305,16 @@ class TelegramCore:
             logger.error(f"Error setting up event handlers: {e}", exc_info=True)
             raise
 
-    async def send_message(self, message, channel_name=None, topic_id=None, image_path=None):
-        """Send a message to the target group or channel"""
+    async def send_message(self, message, channel_name=None, topic_id=None, image_path=None, image_key=None, image_loader=None, images=None):
+        """Send a message to the target group or channel.
+
+        image_key identifies the image in the media cache (e.g. its URL);
+        image_loader is an async callable returning the image file, only
+        called when the image has to be uploaded. images is a list of
+        (image_key, image_loader) pairs sent as one album with message as
+        its caption.
+        """
+        group = None
         try:
             # 日志输出参数
             logger.info(f"Attempting to send message: {message}")
@@ -190,7 +331,6 @@ class TelegramCore:
                     return {"error": "No channel specified"}
             
             # 获取群组实体
-            logger.info(f"Attempting to get entity for: {channel_name}")
             group = await self.get_group_entity(channel_name)
             
             if not group:
@@ -203,77 +343,227 @@ class TelegramCore:
             else:
                 logger.info(f"Found entity with ID: {group.id} (no title available)")
                 
-            if image_path:
+            has_image = image_path is not None or image_loader is not None
+            send_kwargs = {}
+            if has_image:
                 # 发送带图片的消息
                 logger.info(f"Sending message with image to topic {topic_id}")
-                if topic_id:
-                    result = await self.client.send_message(
-                        group,
-                        message,
-                        file=image_path,
-                        reply_to=topic_id
-                    )
-                else:
-                    result = await self.client.send_message(
-                        group,
-                        message,
-                        file=image_path
-                    )
+            elif topic_id:
+                logger.info(f"Sending text message to topic {topic_id}")
             else:
-                # 发送纯文本消息
-                if topic_id:
-                    logger.info(f"Sending text message to topic {topic_id}")
-                    result = await self.client.send_message(
-                        group,
-                        message,
-                        reply_to=topic_id
-                    )
-                else:
-                    logger.info("Sending text message without topic")
-                    result = await self.client.send_message(
-                        group,
-                        message
-                    )
+                logger.info("Sending text message without topic")
+            if topic_id:
+                send_kwargs['reply_to'] = topic_id
+
+            if images:
+                logger.info(f"Sending album of {len(images)} images to topic {topic_id}")
+                messages = await self._send_album(group, message, send_kwargs, images)
+                message_ids = [m.id for m in messages]
+                logger.info(f"Album sent successfully! Message IDs: {message_ids}")
+                return {"status": "success", "message": "Album sent successfully", "message_id": message_ids[0], "message_ids": message_ids}
+            if has_image:
+                result = await self._send_media(group, message, send_kwargs, image_path, image_key, image_loader)
+            else:
+                result = await self._submit_send(group, message, send_kwargs)
             
             logger.info(f"Message sent successfully! Message ID: {result.id}")
             return {"status": "success", "message": "Message sent successfully", "message_id": result.id}
             
+        except PEER_ERRORS as e:
+            # 实体可能已失效，下次发送时重新解析
+            logger.error(f"Peer error sending message to {channel_name}: {e}")
+            self.entity_cache.invalidate(self.entity_cache.normalize_key(channel_name))
+            if group is not None:
+                self.forget_entity(group.id)
+            return {"error": str(e)}
         except Exception as e:
             logger.error(f"Error sending message: {e}")
             import traceback
             logger.error(f"Stack trace: {traceback.format_exc()}")
             return {"error": str(e)}
 
-    async def start_daily_verification(self):
-        """Start the daily verification task"""
+    async def _submit_send(self, group, message, send_kwargs):
+        """Send through the outbox so that rate limits and FloodWait retries apply"""
+        def factory():
+            # 重试时文件对象需要从头读取
+            file = send_kwargs.get('file')
+            if hasattr(file, 'seek'):
+                file.seek(0)
+            return self.client.send_message(group, message, **send_kwargs)
+
+        return await self.outbox.submit(get_peer_id(group), factory)
+
+    async def _send_media(self, group, message, send_kwargs, image_path=None, image_key=None, image_loader=None):
+        """Send a message with an image, reusing an already uploaded copy when possible"""
+        keys = [image_key] if image_key else []
+        if image_path is not None and not (image_key or '').startswith('sha256:'):
+            keys.append(MediaCache.content_key(image_path))
+        keys = [key for key in keys if key]
+
+        # 同一图片正在上传时等待其完成，然后复用上传结果（上传失败则由下一个发送接手）
         while True:
+            pending = next((self._pending_uploads[key] for key in keys if key in self._pending_uploads), None)
+            if not pending:
+                break
+            await asyncio.shield(pending)
+
+        media = self.media_cache.get(*keys) if keys else None
+        if media is not None:
             try:
-                # 等待到下一个整点
-                now = datetime.now()
-                next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-                await asyncio.sleep((next_hour - now).total_seconds())
-                
-                # 生成新的每日密码
-                self.daily_password = self.generate_password()
-                if self.message_handlers:
-                    self.message_handlers.daily_password = self.daily_password
-                
-                # 发送每日密码到群组
-                if self.group_entity:
-                    await self.send_message(
-                        self.group_entity,
-                        f"今日新用户解禁密码是：{self.daily_password}"
-                    )
-                
+                result = await self._submit_send(group, message, dict(send_kwargs, file=media))
+            except FILE_REFERENCE_ERRORS as e:
+                logger.warning(f"Cached media for {keys[0]} is no longer valid ({e}), uploading again")
+                self.media_cache.invalidate(*keys)
+            else:
+                if isinstance(media, (InputFile, InputFileBig)):
+                    # 预上传的文件发送后换成消息中的媒体引用，之后可长期复用
+                    sent = result.photo or result.document
+                    if sent is not None:
+                        self.media_cache.set(keys, sent, size=self.media_cache.size(keys[0]))
+                return result
+
+        upload = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._pending_uploads.setdefault(key, upload)
+        try:
+            if image_path is None:
+                image_path = await image_loader()
+            if not any(key.startswith('sha256:') for key in keys):
+                content_key = MediaCache.content_key(image_path)
+                if content_key:
+                    keys.append(content_key)
+            result = await self._submit_send(group, message, dict(send_kwargs, file=image_path))
+            media = result.photo or result.document
+            if media is not None and keys:
+                self.media_cache.set(keys, media, size=self._media_size(image_path))
+            return result
+        finally:
+            for key in keys:
+                if self._pending_uploads.get(key) is upload:
+                    del self._pending_uploads[key]
+            upload.set_result(None)
+
+    async def _send_album(self, group, message, send_kwargs, images):
+        """Upload all album images concurrently, then send them with a single grouped request"""
+        for attempt in range(2):
+            uploads = await asyncio.gather(*(self._upload_album_photo(group, key, loader) for key, loader in images))
+            photos = [photo for photo, _ in uploads]
+
+            def factory():
+                return self.client.send_file(group, photos, caption=message, **send_kwargs)
+
+            try:
+                return await self.outbox.submit(get_peer_id(group), factory)
+            except FILE_REFERENCE_ERRORS as e:
+                if attempt:
+                    raise
+                # 有缓存的图片引用失效，全部清除后重新上传
+                logger.warning(f"Cached album media is no longer valid ({e}), uploading again")
+                for _, keys in uploads:
+                    self.media_cache.invalidate(*keys)
+
+    async def _upload_album_photo(self, group, image_key, image_loader):
+        """Return (photo, cache keys) for one album image, uploading it unless cached"""
+        keys = [image_key] if image_key else []
+        while True:
+            pending = next((self._pending_uploads[key] for key in keys if key in self._pending_uploads), None)
+            if not pending:
+                break
+            await asyncio.shield(pending)
+
+        media = self.media_cache.get(*keys) if keys else None
+        if media is not None and not isinstance(media, (InputFile, InputFileBig)):
+            return media, keys
+
+        upload = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._pending_uploads.setdefault(key, upload)
+        try:
+            size = self.media_cache.size(keys[0]) if media is not None else 0
+            if media is None:
+                # 上传文件内容，预上传过的图片直接使用
+                image_file = await image_loader()
+                if not (image_key or '').startswith('sha256:'):
+                    keys.append(MediaCache.content_key(image_file))
+                size = self._media_size(image_file)
+                media = await self.client.upload_file(image_file, file_name=getattr(image_file, 'name', None))
+            # 相册需要已在服务器上的图片，上传后转换为Photo
+            result = await self.client(UploadMediaRequest(group, InputMediaUploadedPhoto(media)))
+            self.media_cache.set(keys, result.photo, size=size)
+            return result.photo, keys
+        finally:
+            for key in keys:
+                if self._pending_uploads.get(key) is upload:
+                    del self._pending_uploads[key]
+            upload.set_result(None)
+
+    async def preload_media(self, image_key, image_loader):
+        """Upload an image before a scheduled send; return False if it is already cached.
+
+        The uploaded file is cached under image_key, so the send at the due
+        time only has to reference it instead of uploading the bytes.
+        """
+        if image_key in self.media_cache or image_key in self._pending_uploads:
+            return False
+        upload = asyncio.get_running_loop().create_future()
+        self._pending_uploads[image_key] = upload
+        try:
+            image_file = await image_loader()
+            input_file = await self.client.upload_file(image_file, file_name=getattr(image_file, 'name', None))
+            self.media_cache.set([image_key], input_file, size=self._media_size(image_file), ttl=self.preload_ttl)
+            logger.info(f"Preloaded media {image_key}")
+            return True
+        finally:
+            if self._pending_uploads.get(image_key) is upload:
+                del self._pending_uploads[image_key]
+            upload.set_result(None)
+
+    @staticmethod
+    def _media_size(image_path):
+        if hasattr(image_path, 'getbuffer'):
+            return image_path.getbuffer().nbytes
+        if hasattr(image_path, 'seek') and hasattr(image_path, 'tell'):
+            position = image_path.tell()
+            size = image_path.seek(0, os.SEEK_END)
+            image_path.seek(position)
+            return size
+        if isinstance(image_path, (bytes, bytearray)):
+            return len(image_path)
+        if isinstance(image_path, str) and os.path.isfile(image_path):
+            return os.path.getsize(image_path)
+        return 0
+
+    async def rotate_password(self):
+        """Generate a new verification password (run by the recurring job engine)"""
+        self.daily_password = self.generate_password()
+        if self.message_handlers:
+            self.message_handlers.daily_password = self.daily_password
+        logger.info("Verification password rotated")
+        
+        # 发送新密码到群组
+        if self.announce_password and self.target_group:
+            await self.send_message(f"今日新用户解禁密码是：{self.daily_password}", channel_name=self.target_group)
+
+    async def _snapshot_loop(self):
+        """Periodically snapshot the session to disk"""
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.session.snapshot_async()
             except Exception as e:
-                logger.error(f"Error in daily verification task: {e}", exc_info=True)
-                await asyncio.sleep(60)  # 出错后等待1分钟再试
+                logger.error(f"Error writing session snapshot: {e}")
 
     async def stop(self):
         """Stop the Telegram core service"""
         try:
+            if self._snapshot_task:
+                self._snapshot_task.cancel()
+                self._snapshot_task = None
             if self.client:
+                # 断开连接时会话会写入最终快照
                 await self.client.disconnect()
+            await self.outbox.stop()
+            await self.peer_store.close()
             self.is_running = False  # 设置运行状态
             logger.info("Telegram core service stopped successfully")
         except Exception as e:
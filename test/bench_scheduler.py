@@ -0,0 +1,126 @@
+"""Benchmark the scheduler with a large backlog of pending jobs.
+
+Compares the memory held by one sleeping task per job (how scheduled
+messages used to be sent) with the heap dispatcher in scheduler.py, and
+measures how late the heap dispatcher fires jobs that come due.
+
+    python test/bench_scheduler.py --jobs 100000 --due 2000
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import logging
+import sqlite3
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from schedule_store import ScheduleStore
+from scheduler import Scheduler
+
+KIND = 'bench.send'
+PAYLOAD = {'message': 'benchmark message', 'channel': 'Account_Abstraction_Community', 'topic_id': 18472}
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+def fill_store(path, jobs, due, window, lead):
+    """Insert jobs pending rows: due of them over window seconds starting lead seconds out, the rest a day out"""
+    store = ScheduleStore(path)
+    store._connect().close()
+    now = time.time()
+    rows = []
+    for i in range(jobs):
+        due_at = now + lead + window * i / due if i < due else now + 86400 + i
+        rows.append((uuid.uuid4().hex, KIND, 'pending', due_at, now, json.dumps(PAYLOAD)))
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            'INSERT INTO scheduled_jobs (id, kind, status, due_at, created_at, payload) VALUES (?, ?, ?, ?, ?, ?)',
+            rows
+        )
+    conn.close()
+    return store
+
+async def bench_sleeping_tasks(jobs):
+    """Old approach: one asyncio task per job, sleeping until due with its payload in the closure"""
+    async def send_later(delay, payload):
+        await asyncio.sleep(delay)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(send_later(86400 + i, dict(PAYLOAD))) for i in range(jobs)]
+    await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return memory, elapsed
+
+async def bench_heap(path, jobs, due, window, lead):
+    store = fill_store(path, jobs, due, window, lead)
+    lateness = []
+    done = asyncio.Event()
+
+    async def handler(payload, blob):
+        return {'status': 'success'}
+
+    scheduler = Scheduler(store, batch_size=200)
+    scheduler.register(KIND, handler)
+    original_fire = scheduler._fire
+
+    # 在任务开始执行时记录相对due_at的延迟
+    async def timed_fire(job):
+        lateness.append(time.time() - job['due_at'])
+        await original_fire(job)
+        if len(lateness) >= due:
+            done.set()
+    scheduler._fire = timed_fire
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    await scheduler.start()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    try:
+        await asyncio.wait_for(done.wait(), lead + window + 30)
+    except asyncio.TimeoutError:
+        print(f"Only {len(lateness)}/{due} jobs fired")
+    await scheduler.stop()
+    return memory, elapsed, lateness, scheduler.fired
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--due', type=int, default=2000, help='jobs that come due during the run')
+    parser.add_argument('--lead', type=float, default=10.0, help='seconds before the first job is due (covers setup)')
+    parser.add_argument('--window', type=float, default=5.0, help='seconds over which due jobs are spread')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    memory, elapsed = await bench_sleeping_tasks(args.jobs)
+    print(f"sleeping tasks: {args.jobs} jobs, {memory / 1024 / 1024:.1f} MiB, created in {elapsed:.2f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        memory, elapsed, lateness, fired = await bench_heap(
+            os.path.join(directory, 'schedule.db'), args.jobs, args.due, args.window, args.lead
+        )
+    print(f"heap dispatcher: {args.jobs} jobs, {memory / 1024 / 1024:.1f} MiB, loaded in {elapsed:.2f}s")
+    lateness_ms = [value * 1000 for value in lateness]
+    print(
+        f"firing jitter over {fired} jobs: p50 {percentile(lateness_ms, 0.5):.1f}ms "
+        f"p99 {percentile(lateness_ms, 0.99):.1f}ms max {max(lateness_ms, default=0):.1f}ms"
+    )
+
+if __name__ == '__main__':
+    asyncio.run(main())
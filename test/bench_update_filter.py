@@ -0,0 +1,108 @@
+"""Benchmark group message dispatch with and without the update pre-filter.
+
+Feeds synthetic channel message updates through Telethon's own dispatch
+(TelegramClient._dispatch_update) with the handlers registered by
+TelegramCore.setup_handlers, on an offline client. Reports CPU time per
+update and events/s per core, with the pre-filter disabled (every group
+message reaches MessageHandlers.handle_message, as before) and enabled.
+
+    python test/bench_update_filter.py --updates 50000 --chatter 0.95
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import logging
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+from telethon.tl.types import (
+    UpdateNewChannelMessage, Message, PeerChannel, PeerUser, User, Channel, ChatPhotoEmpty, MessageEntityBold
+)
+from telegram_core import TelegramCore
+from message_handlers import MessageHandlers
+
+BOT_ID = 777
+CHATS = 20
+USERS = 500
+
+class Outbox:
+    """Replies are dropped; only dispatch cost is measured"""
+    async def submit(self, chat_id, factory):
+        return None
+
+def make_updates(count, chatter, seed=1):
+    """Channel message updates: chatter fraction plain text, the rest commands and mentions"""
+    rng = random.Random(seed)
+    users = [User(id=1000 + i, first_name=f'user{i}', access_hash=i) for i in range(USERS)]
+    chats = [
+        Channel(id=2000 + i, title=f'group{i}', photo=ChatPhotoEmpty(), date=datetime.now(), megagroup=True, access_hash=i)
+        for i in range(CHATS)
+    ]
+    updates = []
+    for i in range(count):
+        user, chat = rng.choice(users), rng.choice(chats)
+        kind = rng.random()
+        text, mentioned = 'just chatting about the airdrop, anyone around?', False
+        if kind >= chatter:
+            if rng.random() < 0.6:
+                text = '/price'
+            else:
+                text, mentioned = '@cos72bot what is the plan', True
+        message = Message(
+            id=i + 1, peer_id=PeerChannel(chat.id), date=datetime.now(), message=text,
+            from_id=PeerUser(user.id), mentioned=mentioned, entities=[MessageEntityBold(0, 4)]
+        )
+        update = UpdateNewChannelMessage(message=message, pts=i + 1, pts_count=1)
+        # Telethon在收到更新时附带消息中出现的用户和群组
+        update._entities = {user.id: user, -1000000000000 - chat.id: chat}
+        updates.append(update)
+    return updates
+
+def make_core(enabled):
+    core = TelegramCore()
+    core.client = TelegramClient(StringSession(), 1, 'bench')
+    core.client._mb_entity_cache.set_self_user(BOT_ID, True, 0)
+    core.update_filter.enabled = enabled
+    core.message_handlers = MessageHandlers(client=core.client, daily_password='bench', target_group=None, outbox=Outbox())
+    core.setup_handlers()
+    return core
+
+async def run(updates, enabled):
+    core = make_core(enabled)
+    dispatch = core.client._dispatch_update
+    # 预热（事件构建器解析等一次性开销）
+    for update in updates[:100]:
+        await dispatch(update)
+    cpu = time.process_time()
+    for update in updates:
+        # Telethon对每个更新创建一个任务，这里按顺序执行以便计量
+        await dispatch(update)
+    cpu = time.process_time() - cpu
+    return cpu, core.update_filter.stats()
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=50000)
+    parser.add_argument('--chatter', type=float, default=0.95, help='fraction of messages that need no bot action')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    # 与生产相同的INFO级别，但日志不输出到终端
+    logging.getLogger().handlers = [logging.NullHandler()]
+
+    updates = make_updates(args.updates, args.chatter)
+    for label, enabled in (('without pre-filter', False), ('with pre-filter', True)):
+        cpu, stats = await run(updates, enabled)
+        print(
+            f"{label}: {cpu / len(updates) * 1e6:.1f}us CPU per update, "
+            f"{len(updates) / cpu:,.0f} events/s per core, routed {sum(stats['routed'].values())}, "
+            f"dropped {stats['dropped']}, filter {stats['filter_us_per_update']}us per update"
+        )
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+"""Benchmark the web tier against a stubbed Telegram client.
+
+Compares the old Flask dev server + run_coroutine_threadsafe bridge with
+the Quart routes from web_routes.py served by Hypercorn on the bot's loop.
+Each tier runs in its own subprocess; this process only generates load.
+
+    python test/bench_web_tier.py --requests 2000 --concurrency 32
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import subprocess
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import aiohttp
+
+PAYLOAD = {'channel': 'Account_Abstraction_Community/18472', 'message': 'benchmark message'}
+
+class StubCore:
+    """Stands in for TelegramCore: each send costs a fixed network latency"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.client = object()
+        self.is_running = True
+
+    async def send_message(self, message, channel_name=None, topic_id=None, image_path=None, image_key=None, image_loader=None, images=None):
+        await asyncio.sleep(self.latency)
+        return {'status': 'success', 'message': 'Message sent successfully', 'message_id': 1}
+
+def serve_flask(port, latency):
+    """Old tier: Flask in a thread, each request hops onto the loop and blocks on future.result"""
+    from flask import Flask, request, jsonify
+    from telegram_api import TelegramAPI
+
+    loop = asyncio.new_event_loop()
+    telegram_api = TelegramAPI(core=StubCore(latency))
+    app = Flask(__name__)
+
+    @app.route('/api/version')
+    def version():
+        return jsonify({'version': 'bench'})
+
+    @app.route('/api/send_message', methods=['POST'])
+    def send_message():
+        data = request.get_json()
+        community_name, topic_id = data['channel'].split('/')
+        future = asyncio.run_coroutine_threadsafe(
+            telegram_api.send_message(message=data['message'], channel=community_name, topic_id=int(topic_id)),
+            loop
+        )
+        result = future.result(timeout=30)
+        # 与真实路由一致：发送失败返回500
+        return jsonify(result), 500 if 'error' in result else 200
+
+    web_thread = threading.Thread(target=app.run, kwargs={
+        'host': '127.0.0.1', 'port': port, 'debug': False, 'use_reloader': False, 'threaded': True
+    })
+    web_thread.daemon = True
+    web_thread.start()
+    loop.run_forever()
+
+def serve_quart(port, latency):
+    """New tier: web_routes on Quart/Hypercorn, on the same loop as the (stub) core"""
+    from quart import Quart
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+    from telegram_api import TelegramAPI
+    from web_routes import init_web_routes
+
+    async def run():
+        app = Quart(__name__)
+        init_web_routes(app, None, TelegramAPI(core=StubCore(latency)))
+        config = Config()
+        config.bind = [f"127.0.0.1:{port}"]
+        config.accesslog = None
+        await serve(app, config)
+
+    asyncio.run(run())
+
+async def wait_ready(session, url, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{url}/api/version") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+async def load(url, total, concurrency):
+    latencies = []
+    errors = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session, url)
+        remaining = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                start = time.perf_counter()
+                async with session.post(f"{url}/api/send_message", json=PAYLOAD) as resp:
+                    body = await resp.json(content_type=None)
+                    # 状态码之外也检查响应内容，避免把错误响应计为成功
+                    if resp.status != 200 or 'error' in body:
+                        errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'rps': len(latencies) / elapsed,
+        'errors': errors
+    }
+
+def bench(tier, port, args):
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', tier, '--port', str(port), '--latency', str(args.latency)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f"http://127.0.0.1:{port}"
+        asyncio.run(load(url, min(200, args.requests), args.concurrency))  # 预热
+        return asyncio.run(load(url, args.requests, args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.005, help='stubbed Telegram latency in seconds')
+    parser.add_argument('--port', type=int, default=18870)
+    parser.add_argument('--serve', choices=['flask', 'quart'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        logging.disable(logging.CRITICAL)
+        (serve_flask if args.serve == 'flask' else serve_quart)(args.port, args.latency)
+        return
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, stub latency {args.latency * 1000:.1f} ms")
+    print(f"{'tier':<28}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}")
+    for tier, label, port in (('flask', 'flask thread bridge', args.port), ('quart', 'quart on bot loop', args.port + 1)):
+        r = bench(tier, port, args)
+        print(f"{label:<28}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['rps']:>10.1f}{r['errors']:>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Shared pytest fixtures.
+
+fake_tweepy replaces tweepy's Client, API and OAuth1UserHandler with
+offline fakes so TwitterCore/TwitterAPI can be tested without network
+access or credentials.
+"""
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tweepy
+from twitter_core import TwitterCore
+from twitter_api import TwitterAPI
+from scheduler import Scheduler
+from schedule_store import ScheduleStore
+
+class FakeTweepy:
+    """Fake tweepy clients whose calls sleep like a slow HTTP round trip.
+
+    latency maps a method name (get_me, create_tweet, media_upload) to the
+    seconds the call blocks; posted tweet texts are recorded in tweets.
+    """
+
+    def __init__(self, latency=None):
+        self.latency = latency or {}
+        self.tweets = []
+
+    def _call(self, method):
+        delay = self.latency.get(method)
+        if delay:
+            time.sleep(delay)
+
+    def client(self, **kwargs):
+        fake = self
+
+        class FakeClient:
+            def __init__(self):
+                self.session = SimpleNamespace(hooks={'response': []})
+
+            def get_me(self):
+                fake._call('get_me')
+                return SimpleNamespace(data=SimpleNamespace(id=1, username='cbots', name='CBots'))
+
+            def create_tweet(self, text, media_ids=None):
+                fake._call('create_tweet')
+                fake.tweets.append(text)
+                return SimpleNamespace(data={'id': str(len(fake.tweets))})
+
+        return FakeClient()
+
+    def api(self, auth):
+        fake = self
+
+        class FakeAPI:
+            def __init__(self):
+                self.session = SimpleNamespace(hooks={'response': []})
+
+            def media_upload(self, filename, file):
+                fake._call('media_upload')
+                return SimpleNamespace(media_id=42, expires_after_secs=86400)
+
+        return FakeAPI()
+
+    def core(self):
+        return TwitterCore()
+
+    def twitter_api(self, tmp_path):
+        return TwitterAPI(core=self.core(), http=object(), scheduler=Scheduler(ScheduleStore(str(tmp_path / 'schedule.db'))))
+
+@pytest.fixture
+def fake_tweepy(monkeypatch):
+    """Factory: fake_tweepy(get_me=0.2, ...) patches tweepy and returns the FakeTweepy"""
+    for name in ('TWITTER_API_KEY', 'TWITTER_API_SECRET', 'TWITTER_ACCESS_TOKEN',
+                 'TWITTER_ACCESS_TOKEN_SECRET', 'TWITTER_BEARER_TOKEN'):
+        monkeypatch.setenv(name, 'test')
+
+    def install(**latency):
+        fake = FakeTweepy(latency)
+        monkeypatch.setattr(tweepy, 'Client', fake.client)
+        monkeypatch.setattr(tweepy, 'API', fake.api)
+        monkeypatch.setattr(tweepy, 'OAuth1UserHandler', lambda *args: None)
+        return fake
+
+    return install
@@ -0,0 +1,105 @@
+"""Regression test: Twitter calls must not block the event loop shared with Telethon.
+
+Runs offline against fake tweepy clients whose calls sleep like a slow HTTP
+round trip, and fails if the loop is held for more than MAX_LOOP_LAG.
+
+    python -m pytest -q test/test_twitter_loop_blocking.py
+"""
+import os
+import sys
+import time
+import asyncio
+import base64
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+HTTP_LATENCY = 0.2  # 模拟一次Twitter请求的耗时
+MAX_LOOP_LAG = 0.05
+PNG = base64.b64encode(b'\x89PNG\r\n\x1a\n' + b'\x00' * 64).decode()
+
+class LoopMonitor:
+    """Measures the longest gap between event loop iterations"""
+
+    def __init__(self):
+        self.max_lag = 0.0
+        self._last = None
+        self._task = None
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.max_lag = max(self.max_lag, now - self._last - 0.001)
+        self._last = now
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(0.001)
+            self._tick()
+
+    async def __aenter__(self):
+        self._last = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+        await asyncio.sleep(0.01)
+        self.max_lag = 0.0
+        return self
+
+    async def __aexit__(self, *exc):
+        # 被阻塞的调用可能一直没有让出事件循环，退出时补算最后一段间隔
+        self._tick()
+        self._task.cancel()
+
+def slow_tweepy(fake_tweepy):
+    return fake_tweepy(get_me=HTTP_LATENCY, create_tweet=HTTP_LATENCY, media_upload=HTTP_LATENCY)
+
+def assert_not_blocking(coro_factory):
+    async def run():
+        async with LoopMonitor() as monitor:
+            result = await coro_factory()
+        return result, monitor.max_lag
+
+    result, lag = asyncio.run(run())
+    assert lag < MAX_LOOP_LAG, f"Twitter call blocked the event loop for {lag * 1000:.0f}ms"
+    return result
+
+def test_core_calls_do_not_block(fake_tweepy):
+    core = slow_tweepy(fake_tweepy).core()
+
+    async def calls():
+        await core.start()
+        url = await core.send_tweet('hello')
+        status = await core.get_status()
+        await core.stop()
+        return url, status
+
+    url, status = assert_not_blocking(calls)
+    assert url == 'https://twitter.com/cbots/status/1'
+    assert status['username'] == 'cbots'
+
+def test_send_tweet_with_image_does_not_block(fake_tweepy, tmp_path):
+    api = slow_tweepy(fake_tweepy).twitter_api(tmp_path)
+    core = api.core
+
+    async def calls():
+        await core.start()
+        result = await api.send_tweet('hello', image_data=f'data:image/png;base64,{PNG}')
+        await core.stop()
+        return result
+
+    result = assert_not_blocking(calls)
+    assert result['status'] == 'success'
+    assert result['tweet_id'] == '1'
+
+def test_concurrent_tweets_overlap(fake_tweepy):
+    """Tweets run on the thread pool in parallel instead of one after another on the loop"""
+    core = slow_tweepy(fake_tweepy).core()
+
+    async def calls():
+        await core.start()
+        start = time.perf_counter()
+        await asyncio.gather(*(core.send_tweet(f'tweet {i}') for i in range(4)))
+        elapsed = time.perf_counter() - start
+        await core.stop()
+        return elapsed
+
+    elapsed = assert_not_blocking(calls)
+    # 串行执行需要 4 * HTTP_LATENCY
+    assert elapsed < 4 * HTTP_LATENCY * 0.75
@@ -0,0 +1,84 @@
+"""Regression test: a synchronous /api/send_tweet must never post after it has returned.
+
+Runs offline against fake tweepy clients. A tweet held by the rate limiter
+beyond the route timeout fails fast with 429, and a request that times out
+while uploading its image does not create the tweet afterwards.
+
+    python -m pytest -q test/test_twitter_rate_limit.py
+"""
+import os
+import sys
+import time
+import asyncio
+import base64
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from quart import Quart
+import web_routes
+from twitter_core import TWEET_ENDPOINT
+from twitter_rate_limit import request_deadline
+
+PNG = base64.b64encode(b'\x89PNG\r\n\x1a\n' + b'\x00' * 64).decode()
+UPLOAD_LATENCY = 0.5
+
+def exhaust(core, endpoint, resets_in):
+    core.rate_limits._limits[endpoint] = (100, 0, int(time.time() + resets_in))
+
+def test_held_tweet_fails_fast_with_429(fake_tweepy, monkeypatch, tmp_path):
+    fake = fake_tweepy(media_upload=UPLOAD_LATENCY)
+    api = fake.twitter_api(tmp_path)
+    monkeypatch.setattr(web_routes, 'twitter_api', api)
+    app = Quart(__name__)
+    app.register_blueprint(web_routes.web_bp)
+
+    async def calls():
+        await api.core.start()
+        exhaust(api.core, TWEET_ENDPOINT, 600)
+        start = time.perf_counter()
+        response = await app.test_client().post('/api/send_tweet', json={'message': 'hello'})
+        elapsed = time.perf_counter() - start
+        await api.core.stop()
+        return response, await response.get_json(), elapsed
+
+    response, body, elapsed = asyncio.run(calls())
+    assert response.status_code == 429
+    assert 0 < body['resets_in'] <= 600
+    assert body['reset']
+    assert response.headers['Retry-After'] == str(body['resets_in'])
+    assert elapsed < 1
+    assert fake.tweets == []
+
+def test_timed_out_request_does_not_post_later(fake_tweepy, tmp_path):
+    fake = fake_tweepy(media_upload=UPLOAD_LATENCY)
+    api = fake.twitter_api(tmp_path)
+
+    async def calls():
+        await api.core.start()
+        # 上传图片耗时超过截止时间：调用方已放弃，之后不能再发推
+        with request_deadline(UPLOAD_LATENCY / 2):
+            task = asyncio.ensure_future(api.send_tweet('hello', image_data=f'data:image/png;base64,{PNG}'))
+        result = await task
+        await asyncio.sleep(0.1)
+        await api.core.stop()
+        return result
+
+    result = asyncio.run(calls())
+    assert 'error' in result
+    assert fake.tweets == []
+
+def test_without_deadline_tweet_waits_for_reset(fake_tweepy, tmp_path):
+    """Scheduled and job-mode sends keep waiting for the reset as before"""
+    fake = fake_tweepy(media_upload=UPLOAD_LATENCY)
+    api = fake.twitter_api(tmp_path)
+
+    async def calls():
+        await api.core.start()
+        exhaust(api.core, TWEET_ENDPOINT, 0.5)
+        result = await api.send_tweet('hello')
+        await api.core.stop()
+        return result
+
+    result = asyncio.run(calls())
+    assert result['status'] == 'success'
+    assert fake.tweets == ['hello']
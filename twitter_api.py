@@ -3,29 +3,76 @@ import os
 import asyncio
 import tweepy
 from datetime import datetime
-import base64
-import io
-from twitter_core import TwitterCore
+import re
+from twitter_core import TwitterCore, TWEET_ENDPOINT, MEDIA_UPLOAD_ENDPOINT
+from http_session import HttpSession
+from media_cache import MediaCache, load_image, read_image, named_image
+from scheduler import Scheduler
+from twitter_rate_limit import RateLimitExceeded
+from schedule_store import ScheduleStore
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 class TwitterAPI:
-    def __init__(self, core: TwitterCore = None):
+    def __init__(self, core: TwitterCore = None, http: HttpSession = None, scheduler: Scheduler = None):
         self.core = core or TwitterCore()
+        self.http = http or HttpSession()
+        self.scheduler = scheduler or Scheduler(ScheduleStore())  # 持久化的定时任务
+        self.scheduler.register('twitter.send_tweet', self._run_scheduled, prepare=self._prepare_scheduled)
         self.is_running = True
         logger.info("TwitterAPI initialized")
 
-    async def send_tweet(self, message: str, scheduled_time: str = None, image_data: str = None, image_url: str = None):
-        """Send a tweet with optional image"""
+    async def _upload_media(self, image_data: str = None, image_url: str = None, force: bool = False, image_file=None):
+        """Return (media_id, from_cache), reusing an unexpired upload of the same image"""
+        cache = self.core.media_cache
+        if image_file is not None:
+            # 上传的文件直接交给tweepy，不复制到内存
+            keys = [MediaCache.content_key(image_file)]
+            if not force:
+                media_id = cache.get(*keys)
+                if media_id:
+                    return media_id, True
+            size = image_file.seek(0, os.SEEK_END)
+            image_file.seek(0)
+            media = await self.core.request(MEDIA_UPLOAD_ENDPOINT, self.core.api.media_upload, filename=image_file.name or 'image.jpg', file=image_file)
+            expires_after = getattr(media, 'expires_after_secs', None)
+            cache.set(keys, media.media_id, size=size, ttl=expires_after - 300 if expires_after else None)
+            return media.media_id, False
+
+        keys = []
+        if image_url and not image_data:
+            keys.append(MediaCache.url_key(image_url))
+            # URL命中缓存时不再下载
+            if not force and keys[0] in cache:
+                return cache.get(keys[0]), True
+
+        image_bytes, file_name = await load_image(self.http, image_data, image_url)
+        keys.append(MediaCache.content_key(image_bytes))
+        if not force:
+            media_id = cache.get(*keys)
+            if media_id:
+                return media_id, True
+
+        # 上传图片到Twitter
+        media = await self.core.request(MEDIA_UPLOAD_ENDPOINT, self.core.api.media_upload, filename=file_name, file=named_image(image_bytes, file_name))
+        expires_after = getattr(media, 'expires_after_secs', None)
+        cache.set(keys, media.media_id, size=len(image_bytes), ttl=expires_after - 300 if expires_after else None)
+        return media.media_id, False
+
+    async def send_tweet(self, message: str, scheduled_time: str = None, image_data: str = None, image_url: str = None, image_file=None):
+        """Send a tweet with optional image (image_file is closed once the tweet is sent)"""
+        try:
+            return await self._send_tweet(message, scheduled_time, image_data, image_url, image_file)
+        finally:
+            if image_file is not None:
+                image_file.close()
+
+    async def _send_tweet(self, message: str, scheduled_time: str = None, image_data: str = None, image_url: str = None, image_file=None):
         try:
             logger.info(f"Sending tweet: {message}")
             
             # 检查参数
-            if not message and not image_data and not image_url:
+            if not message and not image_data and not image_url and image_file is None:
                 return {"error": "Message or image is required"}
                 
             # 确保客户端已初始化
@@ -45,7 +92,13 @@ class TwitterAPI:
                     logger.error(f"Error initializing Twitter client: {e}")
                     return {"error": f"Twitter client initialization failed: {str(e)}"}
                 
-            # 处理定时发送
+            # 处理图片URL：如果是Markdown格式，提取URL
+            if image_url and not image_data and image_url.startswith('!['):
+                match = re.search(r'\]\((.*?)\)', image_url)
+                if match:
+                    image_url = match.group(1)
+            
+            # 处理定时发送：保存为持久化的定时任务并立即返回任务ID
             if scheduled_time:
                 try:
                     # 格式化时间去掉Z后缀
@@ -56,82 +109,97 @@ class TwitterAPI:
                     # 验证时间是否在未来
                     if scheduled_datetime <= now:
                         return {"error": "Scheduled time must be in the future"}
-                        
-                    delay = (scheduled_datetime - now).total_seconds()
-                    logger.info(f"Tweet scheduled to be sent after {delay} seconds")
-                    
-                    # 设置延迟任务
-                    await asyncio.sleep(delay)
-                    logger.info(f"Executing scheduled tweet after delay")
-                    
                 except ValueError as e:
                     logger.error(f"Invalid scheduled time format: {scheduled_time}")
                     return {"error": f"Invalid scheduled time format: {str(e)}"}
-            
-            media_id = None
-            
-            # 处理图片
-            if image_data:
+                
+                # 图片现在下载并校验，到期前才上传，避免media_id在等待期间过期
                 try:
-                    logger.info("Processing image data...")
-                    # 解码Base64图片数据
-                    if image_data.startswith('data:image'):
-                        # 移除data URI前缀
-                        image_data = image_data.split(',')[1]
-                    
-                    image_bytes = base64.b64decode(image_data)
-                    image_io = io.BytesIO(image_bytes)
-                    
-                    # 上传图片到Twitter
-                    media = self.core.client.media_upload(file=image_io)
-                    media_id = media.media_id
-                    logger.info(f"Image uploaded to Twitter with media ID: {media_id}")
+                    payload, blob = await self._scheduled_payload(message, image_data, image_url, image_file)
                 except Exception as e:
-                    logger.error(f"Error processing image: {e}")
+                    logger.error(f"Error processing scheduled image: {e}")
                     return {"error": f"Error processing image: {str(e)}"}
+                job = await self.scheduler.schedule('twitter.send_tweet', scheduled_datetime, payload, blob)
+                logger.info(f"Tweet scheduled to be sent after {(scheduled_datetime - now).total_seconds()} seconds, job ID: {job['id']}")
+                return {
+                    "status": "scheduled",
+                    "message": f"Tweet scheduled to be sent at {scheduled_datetime.isoformat()}",
+                    "job_id": job['id']
+                }
             
-            # 处理图片URL
-            elif image_url:
+            media_id = None
+            from_cache = False
+            
+            # 处理图片（同一图片在media_id有效期内只上传一次）
+            if image_data or image_url or image_file is not None:
                 try:
-                    logger.info(f"Processing image URL: {image_url}")
-                    # 如果是Markdown格式，提取URL
-                    if image_url.startswith('!['):
-                        import re
-                        match = re.search(r'\]\((.*?)\)', image_url)
-                        if match:
-                            image_url = match.group(1)
-                    
-                    # 上传图片到Twitter
-                    media = self.core.client.media_upload(image_url)
-                    media_id = media.media_id
-                    logger.info(f"Image from URL uploaded to Twitter with media ID: {media_id}")
+                    logger.info("Processing image data..." if image_data or image_file is not None else f"Processing image URL: {image_url}")
+                    media_id, from_cache = await self._upload_media(image_data, image_url, image_file=image_file)
+                    logger.info(f"Image {'reused from cache' if from_cache else 'uploaded to Twitter'} with media ID: {media_id}")
+                except RateLimitExceeded:
+                    raise
                 except Exception as e:
-                    logger.error(f"Error processing image URL: {e}")
-                    return {"error": f"Error processing image URL: {str(e)}"}
+                    logger.error(f"Error processing image: {e}")
+                    label = 'image URL' if image_url and not image_data and image_file is None else 'image'
+                    return {"error": f"Error processing {label}: {str(e)}"}
             
             # 发送推文
             if media_id:
                 # 发送带图片的推文
-                tweet = self.core.client.create_tweet(text=message, media_ids=[media_id])
+                try:
+                    tweet = await self.core.request(TWEET_ENDPOINT, self.core.client.create_tweet, text=message, media_ids=[media_id])
+                except tweepy.BadRequest as e:
+                    if not from_cache:
+                        raise
+                    # 缓存的media_id已失效，重新上传后再试一次
+                    logger.warning(f"Cached media ID {media_id} rejected ({e}), uploading again")
+                    media_id, _ = await self._upload_media(image_data, image_url, force=True, image_file=image_file)
+                    tweet = await self.core.request(TWEET_ENDPOINT, self.core.client.create_tweet, text=message, media_ids=[media_id])
             else:
                 # 发送纯文本推文
-                tweet = self.core.client.create_tweet(text=message)
+                tweet = await self.core.request(TWEET_ENDPOINT, self.core.client.create_tweet, text=message)
             
             logger.info(f"Tweet sent successfully! Tweet ID: {tweet.data['id']}")
             result = {
-                "status": "scheduled" if scheduled_time else "success",
-                "message": "Tweet scheduled for sending" if scheduled_time else "Tweet sent successfully",
+                "status": "success",
+                "message": "Tweet sent successfully",
                 "tweet_id": tweet.data['id']
             }
             
             return result
             
+        except RateLimitExceeded as e:
+            logger.warning(f"Tweet not sent: {e}")
+            return e.to_dict()
         except Exception as e:
             logger.error(f"Error sending tweet: {e}")
             import traceback
             logger.error(f"Stack trace: {traceback.format_exc()}")
             return {"error": str(e)}
 
+    async def _scheduled_payload(self, message, image_data=None, image_url=None, image_file=None):
+        """Return (payload, image bytes) to persist for a scheduled tweet"""
+        blob, name = await read_image(self.http, image_data, image_url, image_file)
+        return {'message': message, 'image_url': image_url, 'image_name': name}, blob
+
+    async def _prepare_scheduled(self, payload, blob):
+        """Scheduler prepare hook: upload the image of a twitter.send_tweet job before it is due"""
+        if not blob or not self.core.api:
+            return
+        media_id, from_cache = await self._upload_media(image_file=named_image(blob, payload.get('image_name')))
+        if not from_cache:
+            logger.info(f"Preloaded media ID {media_id} for scheduled tweet")
+
+    async def _run_scheduled(self, payload, blob):
+        """Scheduler handler for twitter.send_tweet jobs"""
+        image_file = named_image(blob, payload.get('image_name')) if blob else None
+        logger.info("Sending scheduled tweet")
+        return await self.send_tweet(
+            message=payload['message'],
+            image_url=None if blob else payload.get('image_url'),
+            image_file=image_file
+        )
+
     async def get_status(self):
         """Get Twitter API service status"""
         if not self.core:
@@ -141,7 +209,14 @@ class TwitterAPI:
             return {"status": "error", "message": "Twitter client not initialized"}
             
         # 如果TwitterAPI实例已初始化，认为服务正在运行
-        return {"status": "running", "message": "Twitter service is running"}
+        return {
+            "status": "running",
+            "message": "Twitter service is running",
+            "username": self.core.identity['username'] if self.core.identity else None,
+            "media_cache": self.core.media_cache.stats(),
+            "rate_limits": self.core.rate_limits.stats(),
+            "scheduler": await self.scheduler.stats()
+        }
 
     async def start(self):
         """Start the Twitter API service"""
@@ -153,6 +228,9 @@ class TwitterAPI:
             
             if self.core and not self.core.is_running:
                 await self.core.start()
+            
+            # 启动定时任务调度（与Telegram共用时只会启动一次）
+            await self.scheduler.start()
                 
             self.is_running = True
             logger.info(f"Twitter API service started successfully - is_running: {self.is_running}")
@@ -1,17 +1,22 @@
 import logging
 import os
+import time
 import tweepy
 from datetime import datetime
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
+from media_cache import MediaCache
+from twitter_rate_limit import RateLimiter, deadline_remaining
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# 限额按接口统计（与响应头对应的路径一致）
+TWEET_ENDPOINT = 'POST /2/tweets'
+ME_ENDPOINT = 'GET /2/users/me'
+MEDIA_UPLOAD_ENDPOINT = 'POST /1.1/media/upload.json'
+
 class TwitterCore:
     def __init__(self):
         self.api_key = os.getenv('TWITTER_API_KEY')
@@ -20,9 +25,48 @@ class TwitterCore:
         self.access_token_secret = os.getenv('TWITTER_ACCESS_TOKEN_SECRET')
         self.bearer_token = os.getenv('TWITTER_BEARER_TOKEN')
         self.client = None
+        self.api = None  # v1.1 API，仅用于媒体上传（v2 Client 没有上传接口）
         self.is_running = False
+        # tweepy是同步HTTP客户端，所有调用放到专用线程池，不阻塞Telegram所在的事件循环
+        self.max_workers = int(os.getenv('TWITTER_MAX_WORKERS', 4))
+        self._executor = None
+        self.rate_limits = RateLimiter(max_wait=float(os.getenv('TWITTER_RATE_LIMIT_MAX_WAIT', 900)))
+        # 当前账号信息只在启动时获取一次，过期后在后台刷新
+        self.identity = None
+        self.identity_ttl = float(os.getenv('TWITTER_IDENTITY_TTL', 6 * 3600))
+        self._identity_fetched_at = 0
+        self._identity_task = None
+        # media_id 在上传后24小时过期，缓存时间留出余量
+        self.media_cache = MediaCache(
+            max_size=int(os.getenv('TWITTER_MEDIA_CACHE_SIZE', 256)),
+            ttl=float(os.getenv('TWITTER_MEDIA_CACHE_TTL', 23 * 3600))
+        )
         logger.info("TwitterCore initialized")
 
+    async def call(self, func, *args, **kwargs):
+        """Run a blocking tweepy call on the Twitter thread pool"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='twitter')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def request(self, endpoint, func, *args, **kwargs):
+        """Run a tweepy call once endpoint has rate-limit budget; a 429 is retried after the reset"""
+        for attempt in range(2):
+            await self.rate_limits.acquire(endpoint)
+            # 同步请求已超时返回时，不再发起新的调用（避免之后才发出推文）
+            left = deadline_remaining()
+            if left is not None and left <= 0:
+                raise TimeoutError(f"Request deadline passed before calling {endpoint}")
+            # 重试时文件对象需要从头读取
+            if hasattr(kwargs.get('file'), 'seek'):
+                kwargs['file'].seek(0)
+            try:
+                return await self.call(func, *args, **kwargs)
+            except tweepy.TooManyRequests:
+                if attempt:
+                    raise
+                logger.warning(f"Twitter returned 429 for {endpoint}, retrying after the rate limit resets")
+
     async def start(self):
         """Start the Twitter core service"""
         try:
@@ -44,10 +88,16 @@ class TwitterCore:
                 access_token=self.access_token,
                 access_token_secret=self.access_token_secret
             )
+            self.api = tweepy.API(tweepy.OAuth1UserHandler(
+                self.api_key, self.api_secret, self.access_token, self.access_token_secret
+            ))
+            # 从响应头记录各接口剩余的调用次数
+            for session in (self.client.session, self.api.session):
+                session.hooks['response'].append(self.rate_limits.record)
             
-            # 测试API连接
-            me = self.client.get_me()
-            logger.info(f"Twitter API credentials verified successfully. Connected as: {me.data.username}")
+            # 测试API连接，同时缓存账号信息
+            identity = await self._fetch_identity()
+            logger.info(f"Twitter API credentials verified successfully. Connected as: {identity['username']}")
             
             # 设置服务状态为运行中
             self.is_running = True
@@ -59,18 +109,53 @@ class TwitterCore:
             logger.error(f"Error starting Twitter core service: {e}", exc_info=True)
             raise
 
+    async def get_identity(self):
+        """Return the cached account identity ({'id', 'username', 'name'}).
+
+        Only the first call waits for get_me; after identity_ttl the cached
+        value is still returned while a background task refreshes it.
+        """
+        if self.identity is None:
+            return await self._fetch_identity()
+        if time.monotonic() - self._identity_fetched_at > self.identity_ttl and not self._identity_task:
+            self._identity_task = asyncio.create_task(self._refresh_identity())
+        return self.identity
+
+    async def _fetch_identity(self):
+        me = await self.request(ME_ENDPOINT, self.client.get_me)
+        self.identity = {'id': str(me.data.id), 'username': me.data.username, 'name': me.data.name}
+        self._identity_fetched_at = time.monotonic()
+        return self.identity
+
+    async def _refresh_identity(self):
+        try:
+            await self._fetch_identity()
+            logger.info(f"Twitter identity refreshed: {self.identity['username']}")
+        except Exception as e:
+            # 刷新失败时继续使用旧的账号信息
+            logger.warning(f"Error refreshing Twitter identity: {e}")
+        finally:
+            self._identity_task = None
+
     async def stop(self):
         """Stop the Twitter core service"""
         try:
             logger.info("Stopping Twitter core service...")
             self.is_running = False
+            if self._identity_task:
+                self._identity_task.cancel()
+                self._identity_task = None
+            if self._executor:
+                # 丢弃排队中的调用，退出时只需等待正在执行的请求
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
             logger.info("Twitter core service stopped successfully")
         except Exception as e:
             logger.error(f"Error stopping Twitter core service: {e}", exc_info=True)
             raise
 
-    async def send_tweet(self, message: str, scheduled_time: str = None) -> str:
-        """发送推文"""
+    async def send_tweet(self, message: str) -> str:
+        """发送推文（定时发送由TwitterAPI的调度器负责）"""
         try:
             if not self.client:
                 logger.error("Twitter client not initialized")
@@ -78,26 +163,12 @@ class TwitterCore:
                 
             logger.info(f"Attempting to send tweet: {message}")
             
-            if scheduled_time:
-                # 解析计划时间
-                scheduled_datetime = datetime.fromisoformat(scheduled_time.replace('Z', '+00:00'))
-                now = datetime.utcnow()
-                
-                if scheduled_datetime <= now:
-                    return {"error": "Scheduled time must be in the future"}
-                
-                # 计算延迟时间
-                delay = (scheduled_datetime - now).total_seconds()
-                logger.info(f"Scheduling tweet for {scheduled_datetime} (delay: {delay}s)")
-                await asyncio.sleep(delay)
-            
             # 使用 v2 API 发送推文
-            response = self.client.create_tweet(text=message)
+            response = await self.request(TWEET_ENDPOINT, self.client.create_tweet, text=message)
             tweet_id = response.data['id']
             
-            # 获取用户信息以构建推文URL
-            me = self.client.get_me()
-            username = me.data.username
+            # 使用缓存的账号信息构建推文URL
+            username = (await self.get_identity())['username']
             
             # 构建推文URL
             tweet_url = f"https://twitter.com/{username}/status/{tweet_id}"
@@ -117,11 +188,13 @@ class TwitterCore:
             if not self.is_running:
                 return {"status": "stopped"}
                 
-            me = self.client.get_me()
+            identity = await self.get_identity()
             return {
                 "status": "running",
-                "username": me.data.username,
-                "timestamp": datetime.now().isoformat()
+                "username": identity['username'],
+                "timestamp": datetime.now().isoformat(),
+                "media_cache": self.media_cache.stats(),
+                "rate_limits": self.rate_limits.stats()
             }
             
         except Exception as e:
@@ -0,0 +1,139 @@
+import logging
+import re
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# 路径中的数字ID归一化（不包括开头的API版本号），同一接口共用一个限额
+ID_SEGMENT_RE = re.compile(r'(?<=.)/\d+(?=/|$)')
+
+# 同步请求的截止时间（monotonic），由发起请求的任务继承；超过后不再等待限额，也不再发起新的调用
+REQUEST_DEADLINE = contextvars.ContextVar('twitter_request_deadline', default=None)
+
+@contextmanager
+def request_deadline(seconds):
+    """Calls started inside this block (and tasks created in it) must finish within seconds"""
+    token = REQUEST_DEADLINE.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        REQUEST_DEADLINE.reset(token)
+
+def deadline_remaining():
+    """Seconds left before the current request deadline, or None without one"""
+    deadline = REQUEST_DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+class RateLimitExceeded(Exception):
+    """The endpoint's quota is exhausted for longer than the caller is willing to wait"""
+
+    def __init__(self, endpoint, reset):
+        self.endpoint = endpoint
+        self.reset = reset
+        super().__init__(f"Twitter rate limit for {endpoint} exhausted until {datetime.fromtimestamp(reset).isoformat()}")
+
+    def to_dict(self):
+        return {
+            'error': str(self),
+            'rate_limited': True,
+            'endpoint': self.endpoint,
+            'reset': datetime.fromtimestamp(self.reset).isoformat(),
+            'resets_in': max(0, round(self.reset - time.time()))
+        }
+
+class RateLimiter:
+    """Per-endpoint Twitter quota tracked from x-rate-limit-* response headers.
+
+    record() is installed as a requests response hook on the tweepy
+    sessions (it runs on the Twitter worker threads). acquire() is awaited
+    before each call: while an endpoint has no remaining budget, callers
+    queue in order and are released when its window resets.
+    """
+
+    def __init__(self, max_wait=900):
+        self.max_wait = max_wait  # 超过此等待时间直接报错，不无限期挂起
+        self._limits = {}  # endpoint -> (limit, remaining, reset)
+        self._locks = {}
+        self._waiting = {}
+        self.throttled = 0
+
+    @staticmethod
+    def endpoint(method, url):
+        return f"{method.upper()} {ID_SEGMENT_RE.sub('/:id', urlsplit(url).path)}"
+
+    def record(self, response, *args, **kwargs):
+        """requests response hook: remember the quota reported by Twitter"""
+        headers = response.headers
+        if 'x-rate-limit-remaining' not in headers:
+            return
+        endpoint = self.endpoint(response.request.method, response.request.url)
+        try:
+            limit = int(headers.get('x-rate-limit-limit', 0))
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset = int(headers['x-rate-limit-reset'])
+        except (KeyError, ValueError):
+            return
+        # 每日发推上限（部分套餐）比窗口限额更严格时以它为准
+        if 'x-user-limit-24hour-remaining' in headers:
+            try:
+                daily_remaining = int(headers['x-user-limit-24hour-remaining'])
+                if daily_remaining < remaining:
+                    limit = int(headers.get('x-user-limit-24hour-limit', limit))
+                    remaining = daily_remaining
+                    reset = int(headers['x-user-limit-24hour-reset'])
+            except (KeyError, ValueError):
+                pass
+        if response.status_code == 429:
+            remaining = 0
+        self._limits[endpoint] = (limit, remaining, reset)
+
+    async def acquire(self, endpoint):
+        """Wait until endpoint has budget left, then reserve one call"""
+        lock = self._locks.setdefault(endpoint, asyncio.Lock())
+        self._waiting[endpoint] = self._waiting.get(endpoint, 0) + 1
+        try:
+            # 同一接口的调用按顺序排队，限额恢复后依次放行
+            async with lock:
+                state = self._limits.get(endpoint)
+                if state:
+                    limit, remaining, reset = state
+                    wait = reset - time.time() + 1
+                    if remaining <= 0 and wait > 0:
+                        # 同步请求只等待到它的截止时间
+                        left = deadline_remaining()
+                        if wait > self.max_wait or (left is not None and wait > left):
+                            raise RateLimitExceeded(endpoint, reset)
+                        self.throttled += 1
+                        logger.warning(f"Twitter rate limit for {endpoint} reached, holding call for {wait:.0f}s")
+                        await asyncio.sleep(wait)
+                    elif remaining > 0:
+                        self._limits[endpoint] = (limit, remaining - 1, reset)
+        finally:
+            self._waiting[endpoint] -= 1
+
+    def remaining(self, endpoint):
+        """Remaining calls for endpoint in the current window (None if unknown)"""
+        state = self._limits.get(endpoint)
+        if not state:
+            return None
+        limit, remaining, reset = state
+        return limit if reset <= time.time() else remaining
+
+    def stats(self):
+        now = time.time()
+        endpoints = {}
+        for endpoint, (limit, remaining, reset) in self._limits.items():
+            expired = reset <= now
+            endpoints[endpoint] = {
+                'limit': limit,
+                'remaining': limit if expired else remaining,
+                'reset': datetime.fromtimestamp(reset).isoformat(),
+                'resets_in': 0 if expired else round(reset - now),
+                'waiting': self._waiting.get(endpoint, 0)
+            }
+        return {'throttled': self.throttled, 'endpoints': endpoints}
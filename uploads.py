@@ -0,0 +1,56 @@
+import logging
+import os
+from tempfile import SpooledTemporaryFile
+from quart import jsonify
+from quart.formparser import FormDataParser
+from quart.wrappers import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv('WEB_MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+UPLOAD_SPOOL_BYTES = int(os.getenv('WEB_UPLOAD_SPOOL_BYTES', 1024 * 1024))  # 超过此大小写入临时文件
+
+class UploadFile(SpooledTemporaryFile):
+    """Spooled temporary file for an uploaded image, capped at max_bytes.
+
+    Keeps the client's file name so Telethon/tweepy can tell a photo from
+    a document without the bytes being copied into another buffer.
+    """
+
+    name = None  # 覆盖SpooledTemporaryFile只读的name属性
+
+    def __init__(self, filename=None, max_bytes=MAX_UPLOAD_BYTES, spool_bytes=UPLOAD_SPOOL_BYTES):
+        super().__init__(max_size=spool_bytes, mode='w+b')
+        self.name = os.path.basename(filename) if filename else 'image.jpg'
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        return super().write(data)
+
+def upload_stream_factory(total_content_length, content_type, filename, content_length=None):
+    return UploadFile(filename)
+
+class UploadFormDataParser(FormDataParser):
+    """Form parser that streams file parts into UploadFile"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('stream_factory', upload_stream_factory)
+        super().__init__(*args, **kwargs)
+
+class UploadRequest(Request):
+    form_data_parser_class = UploadFormDataParser
+
+def init_uploads(app):
+    """Stream multipart uploads to spooled temporary files and cap the request size"""
+    app.request_class = UploadRequest
+    # 允许表单字段和multipart开销
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024
+
+    @app.errorhandler(RequestEntityTooLarge)
+    async def upload_too_large(e):
+        return jsonify({'error': f'Upload too large (max {MAX_UPLOAD_BYTES} bytes)'}), 413
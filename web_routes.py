@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, render_template
+from quart import Blueprint, request, jsonify, render_template
 import logging
 import asyncio
 from datetime import datetime
@@ -10,24 +10,32 @@ from telegram_core import TelegramCore
 from twitter_core import TwitterCore
 from telegram_api import TelegramAPI
 from twitter_api import TwitterAPI
+from twitter_rate_limit import request_deadline
+from job_manager import JobManager
+from uploads import init_uploads
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 # Create blueprint
 web_bp = Blueprint('web', __name__)
 
-# Store the main event loop
+# Store the main event loop（网页服务与TelegramCore运行在同一个事件循环上）
 main_loop = None
 telegram_api = None
 twitter_api = None
+recurring_jobs = None
+job_manager = JobManager(
+    max_jobs=int(os.environ.get('JOB_MAX_ENTRIES', 1000)),
+    retention=float(os.environ.get('JOB_RETENTION_SECONDS', 3600))
+)
+
+# 群发限制
+BROADCAST_MAX_TARGETS = int(os.environ.get('BROADCAST_MAX_TARGETS', 100))
+BROADCAST_TIMEOUT = float(os.environ.get('BROADCAST_TIMEOUT', 120))
+SEND_TWEET_TIMEOUT = 30  # 同步发推的等待时间，限额等待超过它时返回429
 
 # Version
-VERSION = "0.23.29"
+VERSION = "0.23.70"
 
 def set_main_loop(loop):
     """Set the main event loop"""
@@ -35,9 +43,10 @@ def set_main_loop(loop):
     main_loop = loop
     print("\033[92m" + f"Bot Version: {VERSION}" + "\033[0m")  # 绿色显示版本号
 
-def init_web_routes(app, telegram_client):
-    """Initialize web routes with the Flask app and Telegram client"""
-    global telegram_api, twitter_api
+def init_web_routes(app, telegram_client, shared_telegram_api=None, shared_recurring_jobs=None, shared_twitter_api=None):
+    """Initialize web routes with the Quart app and Telegram client"""
+    global telegram_api, twitter_api, recurring_jobs
+    recurring_jobs = shared_recurring_jobs
     
     # 获取环境变量
     mode = os.environ.get('MODE', 'dev')
@@ -46,109 +55,204 @@ def init_web_routes(app, telegram_client):
     else:
         logger.info("Running in development mode on port 8873")
     
-    # 初始化 API 实例
-    telegram_core = TelegramCore()
-    telegram_core.client = telegram_client
-    telegram_api = TelegramAPI(core=telegram_core)
+    # 初始化 API 实例，优先复用服务的实例以共享实体缓存
+    if shared_telegram_api:
+        telegram_api = shared_telegram_api
+    else:
+        telegram_core = TelegramCore()
+        telegram_core.client = telegram_client
+        telegram_api = TelegramAPI(core=telegram_core)
     
-    # 初始化 Twitter API 实例
-    twitter_core = TwitterCore()
+    # 初始化 Twitter API 实例，优先复用服务的实例（避免再次登录和获取账号信息）
+    if shared_twitter_api:
+        twitter_api = shared_twitter_api
+    else:
+        twitter_core = TwitterCore()
+        twitter_api = TwitterAPI(core=twitter_core, http=telegram_api.http, scheduler=telegram_api.scheduler)
+        
+        # 在事件循环上后台启动TwitterCore，不阻塞路由初始化
+        try:
+            asyncio.get_running_loop().create_task(_start_twitter_core(twitter_core))
+        except RuntimeError:
+            logger.error("No running event loop when setting up Twitter")
+    
+    # 图片上传以流的方式写入临时文件，并限制请求大小
+    init_uploads(app)
+    
+    # 注册蓝图
+    app.register_blueprint(web_bp)
+
+async def _start_twitter_core(twitter_core):
     try:
-        # 确保TwitterCore启动
-        if main_loop:
-            future = asyncio.run_coroutine_threadsafe(twitter_core.start(), main_loop)
-            future.result(timeout=10)  # 设置10秒超时
-            logger.info(f"Twitter core initialized with status: is_running={twitter_core.is_running}")
-        else:
-            logger.error("Main event loop not initialized when setting up Twitter")
+        await twitter_core.start()
+        logger.info(f"Twitter core initialized with status: is_running={twitter_core.is_running}")
     except Exception as e:
         logger.error(f"Error initializing Twitter core: {e}")
+
+async def wait_for_result(coro, timeout):
+    """Await coro on the current loop; on timeout the send keeps running in the background"""
+    return await asyncio.wait_for(asyncio.shield(asyncio.ensure_future(coro)), timeout)
+
+def wants_job(data):
+    """Whether the client asked for job mode (202 + job ID) instead of waiting"""
+    if request.args.get('mode') == 'async' or 'respond-async' in request.headers.get('Prefer', ''):
+        return True
+    value = data.get('async') if isinstance(data, dict) else None
+    if isinstance(value, str):
+        # 表单字段都是字符串
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+def is_form():
+    """Whether the request body is an HTML form (multipart upload or urlencoded)"""
+    return request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded')
+
+async def read_payload():
+    """Return (data, image_files) from a JSON body or a form (multipart/form-data upload or urlencoded).
+
+    Multipart file parts are streamed into spooled temporary files
+    (see uploads.py); image_files lists one per 'image' part.
+    """
+    if is_form():
+        form = await request.form
+        files = await request.files
+        # 重复的字段(如多个channels)保留为列表
+        data = {key: values if len(values) > 1 else values[0] for key, values in form.lists()}
+        image_files = [upload.stream for upload in files.getlist('image') if upload.filename]
+        return data, image_files
+    return await request.get_json(silent=True) or {}, []
+
+def close_files(image_files):
+    for image_file in image_files:
+        image_file.close()
+
+def closing(coro_factory, image_files):
+    """Wrap a send so the uploaded files are closed when it finishes, including in the background"""
+    async def run():
+        try:
+            return await coro_factory()
+        finally:
+            close_files(image_files)
+    return run
+
+def single_image(image_files):
+    """The first uploaded image for endpoints that take only one (extra uploads are closed)"""
+    for extra in image_files[1:]:
+        extra.close()
+    return image_files[0] if image_files else None
+
+def as_list(value):
+    """A JSON list or repeated form field as a list (a single form value is a str)"""
+    if not value:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def submit_job(kind, coro_factory):
+    """Run coro_factory in the background and return 202 with the job"""
+    job = job_manager.submit(kind, coro_factory, idempotency_key=request.headers.get('Idempotency-Key'))
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job['id']}"
+    return response
+
+CHANNEL_FORMAT_ERROR = 'Invalid channel format. Supported formats: CommunityName/TopicID, https://t.me/c/ChannelID/MessageID, or https://t.me/Username/MessageID'
+
+def parse_channel_link(channel):
+    """Parse a Telegram link into (community_name, topic_id), raise ValueError if unsupported"""
+    community_name = None
+    topic_id = None
     
-    twitter_api = TwitterAPI(core=twitter_core)
+    # 预处理：去除前后空格
+    channel = channel.strip()
+    logger.info(f"Channel after stripping whitespace: '{channel}'")
     
-    # 注册蓝图
-    app.register_blueprint(web_bp)
+    # 格式1: Account_Abstraction_Community/18472
+    if '/' in channel and not channel.startswith('http'):
+        community_name, topic_id = channel.split('/')
+        topic_id = int(topic_id)
+        logger.info(f"Format 1: Extracted community name: {community_name}, topic ID: {topic_id}")
+    # 格式2: https://t.me/c/1807106448/33
+    elif channel.startswith('https://t.me/c/'):
+        parts = channel.replace('https://t.me/c/', '').split('/')
+        if len(parts) == 2:
+            community_name = parts[0]  # 这里是数字ID
+            topic_id = int(parts[1])
+            # 私有频道需要处理成整数ID
+            community_name = int(community_name)
+            logger.info(f"Format 2: Extracted channel ID: {community_name}, topic ID: {topic_id}")
+    # 格式3: https://t.me/ETHPandaOrg/25
+    elif channel.startswith('https://t.me/'):
+        parts = channel.replace('https://t.me/', '').split('/')
+        if len(parts) == 2:
+            community_name = parts[0]  # 这里是用户名
+            topic_id = int(parts[1])
+            logger.info(f"Format 3: Extracted channel username: {community_name}, topic ID: {topic_id}")
+    else:
+        raise ValueError(f"Unsupported channel format: {channel}")
+        
+    if community_name is None or topic_id is None:
+        raise ValueError(f"Failed to parse channel format: {channel}")
+        
+    logger.info(f"Final parsed values - community_name: {community_name}, topic_id: {topic_id}")
+    return community_name, topic_id
 
 @web_bp.route('/')
-def index():
+async def index():
     """Root endpoint"""
-    return render_template('telegram.html')
+    return await render_template('telegram.html')
 
 @web_bp.route('/twitter')
-def twitter():
+async def twitter():
     """Twitter bot page"""
-    return render_template('twitter.html')
+    return await render_template('twitter.html')
 
 @web_bp.route('/telegram')
-def telegram():
+async def telegram():
     """Telegram bot page"""
-    return render_template('telegram.html')
+    return await render_template('telegram.html')
 
 @web_bp.route('/api/send_message', methods=['POST'])
-def send_message():
+async def send_message():
     """Send message endpoint"""
+    # 上传过大时由Quart直接返回413
+    data, image_files = await read_payload()
+    pending = False  # 发送开始后由closing在发送完成时关闭上传的文件
     try:
-        data = request.get_json()
-        logger.info(f"Raw request data: {data}")
+        logger.info(f"Request fields: {sorted(data)}, uploads: {len(image_files)}")
         
         channel = data.get('channel')
         message = data.get('message')
         scheduled_time = data.get('scheduled_time')
-        image_data = data.get('image')  # Base64 encoded image data
+        image_file = image_files[0] if len(image_files) == 1 else None
+        image_data = data.get('image') if not image_files else None  # Base64 encoded image data
         image_url = data.get('image_url')  # URL to an image
         
-        logger.info(f"Parsed request data - Channel: {channel}, Message: {message}, Scheduled time type: {type(scheduled_time)}, Scheduled value: {scheduled_time}, Has Image: {bool(image_data)}, Has Image URL: {bool(image_url)}")
+        # 多张图片(images/image_urls列表或多个上传文件)作为一个相册发送
+        album_images = as_list(data.get('images'))
+        album_urls = as_list(data.get('image_urls'))
+        album_files = []
+        is_album = bool(album_images or album_urls or len(image_files) > 1 or isinstance(image_data, list) or isinstance(image_url, list))
+        if is_album:
+            album_images += as_list(image_data)
+            album_urls += as_list(image_url)
+            album_files = image_files
+            image_file = image_data = image_url = None
+        
+        logger.info(f"Parsed request data - Channel: {channel}, Message: {message}, Scheduled time type: {type(scheduled_time)}, Scheduled value: {scheduled_time}, Has Image: {bool(image_data) or image_file is not None}, Has Image URL: {bool(image_url)}")
         
-        if not channel or (not message and not image_data and not image_url):
+        if not channel or (not message and not image_data and not image_url and image_file is None and not is_album):
             logger.error("Missing channel or message/image in request")
             return jsonify({'error': 'Channel and message/image are required'}), 400
+        if is_album and scheduled_time:
+            return jsonify({'error': 'Scheduled albums are not supported'}), 400
             
         # 处理不同格式的Telegram链接
         try:
-            community_name = None
-            topic_id = None
-            
-            # 预处理：去除前后空格
-            channel = channel.strip()
-            logger.info(f"Channel after stripping whitespace: '{channel}'")
-            
-            # 格式1: Account_Abstraction_Community/18472
-            if '/' in channel and not channel.startswith('http'):
-                community_name, topic_id = channel.split('/')
-                topic_id = int(topic_id)
-                logger.info(f"Format 1: Extracted community name: {community_name}, topic ID: {topic_id}")
-            # 格式2: https://t.me/c/1807106448/33
-            elif channel.startswith('https://t.me/c/'):
-                parts = channel.replace('https://t.me/c/', '').split('/')
-                if len(parts) == 2:
-                    community_name = parts[0]  # 这里是数字ID
-                    topic_id = int(parts[1])
-                    # 私有频道需要处理成整数ID
-                    community_name = int(community_name)
-                    logger.info(f"Format 2: Extracted channel ID: {community_name}, topic ID: {topic_id}")
-            # 格式3: https://t.me/ETHPandaOrg/25
-            elif channel.startswith('https://t.me/'):
-                parts = channel.replace('https://t.me/', '').split('/')
-                if len(parts) == 2:
-                    community_name = parts[0]  # 这里是用户名
-                    topic_id = int(parts[1])
-                    logger.info(f"Format 3: Extracted channel username: {community_name}, topic ID: {topic_id}")
-            else:
-                raise ValueError(f"Unsupported channel format: {channel}")
-                
-            if community_name is None or topic_id is None:
-                raise ValueError(f"Failed to parse channel format: {channel}")
-                
-            logger.info(f"Final parsed values - community_name: {community_name}, topic_id: {topic_id}")
+            community_name, topic_id = parse_channel_link(channel)
         except ValueError as e:
             logger.error(f"Invalid channel format: {channel}, Error: {str(e)}")
-            return jsonify({'error': 'Invalid channel format. Supported formats: CommunityName/TopicID, https://t.me/c/ChannelID/MessageID, or https://t.me/Username/MessageID'}), 400
+            return jsonify({'error': CHANNEL_FORMAT_ERROR}), 400
             
-        # 使用主事件循环
-        if not main_loop:
-            logger.error("Main event loop not initialized")
-            return jsonify({'error': 'Server not ready'}), 500
-        
         logger.info(f"Before send_async - scheduled_time type: {type(scheduled_time)}, value: {scheduled_time}")
             
         async def send_async():
@@ -159,6 +263,16 @@ def send_message():
                 _scheduled_time = scheduled_time  # 创建一个本地变量
                 logger.info(f"Local _scheduled_time variable created: {_scheduled_time}")
                 
+                if is_album:
+                    return await telegram_api.send_album(
+                        message=message,
+                        channel=community_name,
+                        topic_id=topic_id,
+                        images=album_images,
+                        image_urls=album_urls,
+                        image_files=album_files
+                    )
+                
                 # 如果是定时发送
                 if _scheduled_time:
                     logger.info(f"Processing scheduled message with time: {_scheduled_time}")
@@ -169,7 +283,7 @@ def send_message():
                         
                         if scheduled_datetime <= now:
                             logger.error("Scheduled time is in the past")
-                            return jsonify({'error': 'Scheduled time must be in the future'}), 400
+                            return {'error': 'Scheduled time must be in the future'}, 400
                             
                         delay = (scheduled_datetime - now).total_seconds()
                         days = int(delay // (24 * 3600))
@@ -192,7 +306,8 @@ def send_message():
                             topic_id=topic_id,
                             scheduled_time=_scheduled_time,
                             image_data=image_data,
-                            image_url=image_url
+                            image_url=image_url,
+                            image_file=image_file
                         )
                         
                         if 'status' in result and result['status'] == 'scheduled':
@@ -205,7 +320,7 @@ def send_message():
                         
                     except ValueError as e:
                         logger.error(f"Invalid scheduled time format: {_scheduled_time}")
-                        return jsonify({'error': f'Invalid scheduled time format: {str(e)}'}), 400
+                        return {'error': f'Invalid scheduled time format: {str(e)}'}, 400
                 else:
                     # 直发消息
                     logger.info("Sending immediate message - scheduled_time is empty or None")
@@ -215,7 +330,8 @@ def send_message():
                         topic_id=topic_id,
                         scheduled_time=None,
                         image_data=image_data,
-                        image_url=image_url
+                        image_url=image_url,
+                        image_file=image_file
                     )
                     
             except Exception as e:
@@ -224,17 +340,19 @@ def send_message():
                 logger.error(f"Stack trace: {traceback.format_exc()}")
                 return {'error': str(e)}
         
-        logger.info("Creating asyncio task with run_coroutine_threadsafe")
-                
-        # 使用 run_coroutine_threadsafe 在主事件循环中执行异步操作
-        future = asyncio.run_coroutine_threadsafe(send_async(), main_loop)
+        # 任务模式：立即返回任务ID，不阻塞网页线程
+        if wants_job(data):
+            pending = True
+            return submit_job('telegram.send_message', closing(send_async, image_files))
+            
+        # 直接在当前事件循环上等待发送结果
         try:
-            logger.info("Waiting for future result with timeout")
-            result = future.result(timeout=30)  # 设置30秒超时
-            logger.info(f"Future result received: {result}")
+            pending = True  # 超时后发送仍在后台进行，完成时再关闭文件
+            result = await wait_for_result(closing(send_async, image_files)(), 30)  # 设置30秒超时
+            logger.info(f"Send result received: {result}")
             
             if isinstance(result, tuple) and len(result) == 2:
-                return result[0], result[1]
+                return jsonify(result[0]), result[1]
             if 'error' in result:
                 logger.error(f"Error sending message: {result['error']}")
                 return jsonify(result), 500
@@ -255,29 +373,118 @@ def send_message():
         import traceback
         logger.error(f"Stack trace: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
+    finally:
+        if not pending:
+            close_files(image_files)
+
+@web_bp.route('/api/broadcast', methods=['POST'])
+async def broadcast():
+    """Send one message to many channels/topics"""
+    # 上传过大时由Quart直接返回413
+    data, image_files = await read_payload()
+    pending = False  # 发送开始后由closing在发送完成时关闭上传的文件
+    image_file = single_image(image_files)
+    try:
+        channels = data.get('channels')
+        if is_form():
+            channels = as_list(channels)  # 表单中只有一个channels字段时是字符串
+        message = data.get('message')
+        image_data = data.get('image') if image_file is None else None  # Base64 encoded image data
+        image_url = data.get('image_url')  # URL to an image
+        concurrency = data.get('concurrency')
+        
+        logger.info(f"Received broadcast request - Targets: {len(channels) if isinstance(channels, list) else 0}, Has Image: {bool(image_data)}, Has Image URL: {bool(image_url)}")
+        
+        if not isinstance(channels, list) or not channels:
+            return jsonify({'error': 'channels must be a non-empty list'}), 400
+        if len(channels) > BROADCAST_MAX_TARGETS:
+            return jsonify({'error': f'At most {BROADCAST_MAX_TARGETS} channels per broadcast'}), 400
+        if not message and not image_data and not image_url and image_file is None:
+            return jsonify({'error': 'Message or image is required'}), 400
+        if concurrency is not None:
+            try:
+                concurrency = int(concurrency)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'concurrency must be an integer'}), 400
+            
+        # 解析所有链接，格式错误的目标单独返回错误，不影响其他目标
+        results = [None] * len(channels)
+        targets = []
+        for index, channel in enumerate(channels):
+            try:
+                community_name, topic_id = parse_channel_link(str(channel))
+                targets.append((index, community_name, topic_id))
+            except ValueError as e:
+                logger.error(f"Invalid channel format in broadcast: {channel}, Error: {str(e)}")
+                results[index] = {'channel': channel, 'error': CHANNEL_FORMAT_ERROR}
+                
+        async def broadcast_async():
+            if targets:
+                sent = await telegram_api.broadcast(
+                    message=message,
+                    targets=[(community_name, topic_id) for _, community_name, topic_id in targets],
+                    image_data=image_data,
+                    image_url=image_url,
+                    concurrency=concurrency,
+                    image_file=image_file
+                )
+                if 'error' in sent:
+                    return sent
+                for (index, _, _), result in zip(targets, sent['results']):
+                    results[index] = dict(result, channel=channels[index])
+                    
+            failed = sum(1 for r in results if 'error' in r)
+            return {
+                'status': 'success' if not failed else ('partial' if failed < len(results) else 'error'),
+                'sent': len(results) - failed,
+                'failed': failed,
+                'results': results
+            }
+            
+        # 任务模式：立即返回任务ID，不阻塞网页线程
+        if wants_job(data):
+            pending = True
+            return submit_job('telegram.broadcast', closing(broadcast_async, image_files))
+            
+        try:
+            pending = True  # 超时后发送仍在后台进行，完成时再关闭文件
+            result = await wait_for_result(closing(broadcast_async, image_files)(), BROADCAST_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Timeout while broadcasting message")
+            return jsonify({'error': 'Timeout while broadcasting message'}), 500
+        if 'error' in result:
+            return jsonify(result), 500
+        return jsonify(result)
+        
+    except Exception as e:
+        logger.error(f"Error in broadcast: {str(e)}")
+        import traceback
+        logger.error(f"Stack trace: {traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if not pending:
+            close_files(image_files)
 
 @web_bp.route('/api/send_tweet', methods=['POST'])
-def send_tweet():
+async def send_tweet():
     """Send tweet endpoint"""
+    # 上传过大时由Quart直接返回413
+    data, image_files = await read_payload()
+    pending = False  # 发送开始后由closing在发送完成时关闭上传的文件
+    image_file = single_image(image_files)
     try:
-        data = request.get_json()
         message = data.get('message')
         scheduled_time_value = data.get('scheduled_time')  # 使用不同的变量名
-        image_data = data.get('image')  # Base64 encoded image data
+        image_data = data.get('image') if image_file is None else None  # Base64 encoded image data
         image_url = data.get('image_url')  # URL to image
         
-        logger.info(f"Received send_tweet request - Message: {message}, Scheduled: {scheduled_time_value}, Has Image: {bool(image_data)}, Has Image URL: {bool(image_url)}")
+        logger.info(f"Received send_tweet request - Message: {message}, Scheduled: {scheduled_time_value}, Has Image: {bool(image_data) or image_file is not None}, Has Image URL: {bool(image_url)}")
         
         # 检查参数
-        if not message and not image_data and not image_url:
+        if not message and not image_data and not image_url and image_file is None:
             logger.error("Missing message/image in request")
             return jsonify({'error': 'Message or image is required'}), 400
             
-        # 使用主事件循环
-        if not main_loop:
-            logger.error("Main event loop not initialized")
-            return jsonify({'error': 'Server not ready'}), 500
-            
         async def send_async():
             try:
                 # 计算定时发送的延迟时间
@@ -294,7 +501,7 @@ def send_tweet():
                         
                         # 如果时间已经过去，返回错误
                         if scheduled_datetime <= now:
-                            return jsonify({'error': 'Scheduled time must be in the future'}), 400
+                            return {'error': 'Scheduled time must be in the future'}, 400
                         
                         delay = (scheduled_datetime - now).total_seconds()
                         
@@ -312,14 +519,15 @@ def send_tweet():
                         logger.info(f"Tweet scheduled for {delay_info}")
                     except ValueError as e:
                         logger.error(f"Invalid scheduled time format: {_scheduled_time}")
-                        return jsonify({'error': f'Invalid scheduled time format: {str(e)}'}), 400
+                        return {'error': f'Invalid scheduled time format: {str(e)}'}, 400
                 
                 # 发送推文
                 result = await twitter_api.send_tweet(
                     message=message,
                     scheduled_time=_scheduled_time if _scheduled_time else None,
                     image_data=image_data,
-                    image_url=image_url
+                    image_url=image_url,
+                    image_file=image_file
                 )
                 
                 # 添加定时发送信息
@@ -335,12 +543,24 @@ def send_tweet():
                 logger.error(f"Error in send_async: {str(e)}")
                 return {'error': str(e)}
                 
-        # 使用 run_coroutine_threadsafe 在主事件循环中执行异步操作
-        future = asyncio.run_coroutine_threadsafe(send_async(), main_loop)
+        # 任务模式：立即返回任务ID，不阻塞网页线程
+        if wants_job(data):
+            pending = True
+            return submit_job('twitter.send_tweet', closing(send_async, image_files))
+            
+        # 直接在当前事件循环上等待发送结果
         try:
-            result = future.result(timeout=30)  # 设置30秒超时
+            pending = True  # 超时后发送仍在后台进行，完成时再关闭文件
+            # 限额等待超过超时时间时直接返回429，超时后也不会再发出推文（避免客户端重试导致重复发推）
+            with request_deadline(SEND_TWEET_TIMEOUT):
+                result = await wait_for_result(closing(send_async, image_files)(), SEND_TWEET_TIMEOUT)
             if isinstance(result, tuple) and len(result) == 2:
-                return result[0], result[1]
+                return jsonify(result[0]), result[1]
+            if result.get('rate_limited'):
+                response = jsonify(result)
+                response.status_code = 429
+                response.headers['Retry-After'] = str(result['resets_in'])
+                return response
             if 'error' in result:
                 logger.error(f"Error sending tweet: {result['error']}")
                 return jsonify(result), 500
@@ -357,8 +577,102 @@ def send_tweet():
         logger.error(f"Error type: {type(e)}")
         logger.error(f"Error details: {str(e)}")
         return jsonify({'error': str(e)}), 500
+    finally:
+        if not pending:
+            close_files(image_files)
+
+@web_bp.route('/api/jobs/<job_id>')
+async def get_job(job_id):
+    """Job status endpoint"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': f'Job not found: {job_id}'}), 404
+    return jsonify(job)
+
+@web_bp.route('/api/jobs', methods=['GET', 'POST'])
+async def get_jobs():
+    """Batch job status: GET ?ids=a,b or POST {"ids": [...]}; recent jobs without ids"""
+    if request.method == 'POST':
+        ids = (await request.get_json(silent=True) or {}).get('ids') or []
+    else:
+        ids = [i for i in request.args.get('ids', '').split(',') if i]
+    if not ids:
+        return jsonify({'jobs': job_manager.recent(), 'stats': job_manager.stats()})
+    if not isinstance(ids, list):
+        return jsonify({'error': 'ids must be a list'}), 400
+    jobs, missing = job_manager.get_many(ids)
+    return jsonify({'jobs': jobs, 'missing': missing})
+
+@web_bp.route('/api/schedules')
+async def list_schedules():
+    """Scheduled messages/tweets: GET ?status=pending&kind=twitter.send_tweet&limit=100"""
+    try:
+        limit = min(int(request.args.get('limit', 100)), 500)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    scheduler = telegram_api.scheduler
+    jobs = await scheduler.jobs(request.args.get('kind'), request.args.get('status'), limit)
+    return jsonify({'schedules': jobs, 'stats': await scheduler.stats()})
+
+@web_bp.route('/api/schedules/<job_id>', methods=['GET', 'DELETE'])
+async def schedule_detail(job_id):
+    """Get a scheduled job, or cancel it with DELETE while it is still pending"""
+    scheduler = telegram_api.scheduler
+    job = await scheduler.get(job_id)
+    if not job:
+        return jsonify({'error': f'Schedule not found: {job_id}'}), 404
+    if request.method == 'DELETE':
+        if not await scheduler.cancel(job_id):
+            return jsonify({'error': f"Schedule can no longer be cancelled (status: {job['status']})"}), 409
+        job = await scheduler.get(job_id)
+    return jsonify(job)
+
+@web_bp.route('/api/recurring_jobs')
+async def list_recurring_jobs():
+    """Recurring (cron) jobs with their next fire time and last outcome"""
+    if not recurring_jobs:
+        return jsonify({'running': False, 'jobs': []})
+    return jsonify({'running': recurring_jobs.is_running, 'jobs': recurring_jobs.jobs()})
+
+@web_bp.route('/api/recurring_jobs/<name>/run', methods=['POST'])
+async def run_recurring_job(name):
+    """Run a recurring job now, outside its schedule"""
+    if not recurring_jobs or not await recurring_jobs.run_now(name):
+        return jsonify({'error': f'Recurring job not found: {name}'}), 404
+    return jsonify(next(job for job in recurring_jobs.jobs() if job['name'] == name))
+
+@web_bp.route('/api/telegram/status')
+async def telegram_status():
+    """Telegram service status endpoint"""
+    try:
+        result = await telegram_api.get_status()
+        # 不在网页接口暴露每日密码
+        result.pop('daily_password', None)
+        if 'error' in result:
+            return jsonify(result), 500
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in telegram_status: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@web_bp.route('/api/twitter/status')
+async def twitter_status():
+    """Twitter service status endpoint"""
+    try:
+        result = await twitter_api.get_status()
+        if result.get('status') == 'error':
+            return jsonify(result), 503
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in twitter_status: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@web_bp.route('/api/twitter/rate_limits')
+async def twitter_rate_limits():
+    """Remaining Twitter quota per endpoint and when it resets"""
+    return jsonify(twitter_api.core.rate_limits.stats())
 
 @web_bp.route('/api/version')
-def get_version():
+async def get_version():
     """Get version endpoint"""
     return jsonify({'version': VERSION}) 
\ No newline at end of file